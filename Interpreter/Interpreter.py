@@ -18,7 +18,11 @@ Com := Assign(Ide, Exp) | While(Exp, Com) | CIf (Exp, Com, Com)
 Decl := Decl(Ide, Exp)
 """
 
-from dataclasses import dataclass
+import sys
+from array import array
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Callable, Iterable
 
 # --------------------------------------------
 # SYNTACIC DOMAINS
@@ -26,119 +30,164 @@ from dataclasses import dataclass
 
 Ide = str
 
-@dataclass
+# Lexical addresses, filled in by the resolver (see resolver.py) and ignored by
+# interpret. A frame is addressed by its depth along the static links (0 is the
+# current frame) and a name by its slot in that frame. A reference keeps every
+# (depth, slot) that may bind it at run time, innermost first, followed by None
+# when the name may not be bound at all.
+Address = tuple[tuple[int, int] | None, ...]
+
+# A NewPointer or Procedure "shadows" when a reference may find the name it binds
+# ahead of another frame binding the same name: binding it can change what the
+# reference reaches.
+
+# Operators and conditionals are marked "checked" by the type checker (see
+# typechecker.py) when their operands are known to have the right types, in which
+# case their operands are not checked again at run time.
+
+def annotation():
+    """
+    Declares a field holding resolver or type checker information: optional, keyword-only
+    and left out of == and repr
+    """
+    return field(default=None, kw_only=True, compare=False, repr=False)
+
+# Syntax nodes are slotted: they have no per-instance __dict__, which makes them
+# smaller and their fields faster to read (see bench_node_memory in benchmarks.py)
+@dataclass(slots=True)
 class Int:
     value: int
 
-@dataclass
+@dataclass(slots=True)
 class Plus:
     e1: "Exp"
     e2: "Exp"
+    checked: bool | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Mult:
     e1: "Exp"
     e2: "Exp"
+    checked: bool | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Minus:
     e: "Exp"
+    checked: bool | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Bool:
     value: bool
 
-@dataclass
+@dataclass(slots=True)
 class And:
     e1: "Exp"
     e2: "Exp"
+    checked: bool | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Or:
     e1: "Exp"
     e2: "Exp"
+    checked: bool | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Not:
     e: "Exp"
+    checked: bool | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Equal:
     e1: "Exp"
     e2: "Exp"
 
-@dataclass
+@dataclass(slots=True)
 class If:
     c: "Exp"
     e1: "Exp"
     e2: "Exp"
+    checked: bool | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Deref:
     i: Ide
+    addr: Address | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Val:
     i: Ide
+    addr: Address | None = annotation()
 
 Exp = Int | Plus | Mult | Minus | Bool | And | Or | Not | Equal | If | Deref | Val
 
-@dataclass
+@dataclass(slots=True)
 class Assign:
     i: Ide
     v: Exp
+    addr: Address | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class While:
     c: Exp
     b: "Com"
 
-@dataclass
+@dataclass(slots=True)
 class CIf:
     c: Exp
     b1: "Com"
     b2: "Com"
 
-@dataclass
+@dataclass(slots=True)
 class Procedure:
     name: Ide
     parameters: list[Ide]
     body: list["Com"]
+    slot: int | None = annotation()
+    param_slots: tuple[int, ...] | None = annotation()
+    size: int | None = annotation()
+    shadows: bool | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Call:
     name: Ide
     parameters: list["Exp"]
+    addr: Address | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class NewPointer:
     i: Ide
     c: "Exp"
+    slot: int | None = annotation()
+    shadows: bool | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class DestroyPointer:
     i: Ide
+    addr: Address | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class UpdatePointerVal:
     i: Ide
     c: Exp
+    addr: Address | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Block:
     dl: list["Decl"]
     cl: list["Com"]
+    size: int | None = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Show:
     e: Exp
 
 Com = Assign | While | CIf | Procedure | Call | NewPointer | DestroyPointer | UpdatePointerVal | Block | Show
 
-@dataclass
+@dataclass(slots=True)
 class Decl:
     i: Ide
     e: Exp
+    slot: int | None = annotation()
 
 # --------------------------------------------
 # SEMANTIC DOMAINS
@@ -155,6 +204,10 @@ class EBool:
 
 Eval = EInt | EBool
 
+# Shared instances of the boolean results, so conditions do not build a new EBool every time
+ETRUE = EBool(True)
+EFALSE = EBool(False)
+
 # Denotable values
 @dataclass
 class DInt:
@@ -274,41 +327,114 @@ def hval_to_sval(v: Hval) -> Sval:
             return SBool(b)
 
 # --------------------------------------------
-# STRUCTURES: ENVIRONMENT, STORE AND FRAMES
+# NATIVE VALUES
 # --------------------------------------------
 
-# Defining the enviornment as a stack
-@dataclass
-class Bind:
-    identifier: Ide
-    value: Dval
+# The compiled backends (compiler.py, vm.py) do not wrap values in the dataclasses
+# above: integers and booleans are plain Python ints and bools (told apart with
+# type(v), since bool is a subclass of int) and pointers are Pointer objects.
+# The functions below convert them to and from the dataclasses, which remain the
+# public view of values.
+
+class Pointer:
+    """
+    Native storable value of a pointer variable: the location of its heap cell
+    """
+    __slots__ = ("loc",)
+
+    def __init__(self, loc: int):
+        self.loc = loc
+
+    def __repr__(self):
+        return f"Pointer({self.loc})"
+
+    def __eq__(self, other):
+        return type(other) is Pointer and other.loc == self.loc
+
+    def __hash__(self):
+        return hash(self.loc)
+
+def native_to_eval(v) -> Eval:
+    """
+    Converts a native integer or boolean into an expressible value
+    """
+    if type(v) is bool:
+        return EBool(v)
+    if type(v) is int:
+        return EInt(v)
+    raise Exception("Trying to convert a non-expressible value")
+
+def native_to_sval(v) -> Sval:
+    """
+    Converts a native integer, boolean or pointer into a storable value
+    """
+    if type(v) is Pointer:
+        return SPointer(v.loc)
+    if type(v) is bool:
+        return SBool(v)
+    if type(v) is int:
+        return SInt(v)
+    raise Exception("Trying to convert a non-storable type")
+
+def native_to_hval(v) -> Hval:
+    """
+    Converts a native integer or boolean into a heapable value
+    """
+    if type(v) is bool:
+        return HBool(v)
+    if type(v) is int:
+        return HInt(v)
+    raise Exception("Trying to convert a non-heapable type")
+
+def hval_to_native(v: Hval):
+    """
+    Converts a heapable value into a native value
+    """
+    match v:
+        case HInt(i):
+            return i
+        case HBool(b):
+            return b
+        case _:
+            raise Exception("Trying to convert a non-heapable type")
+
+def sval_to_native(v: Sval):
+    """
+    Converts a storable value into a native value
+    """
+    if type(v) is SPointer:
+        return Pointer(v.v)
+    return v.v
+
+# --------------------------------------------
+# STRUCTURES: ENVIRONMENT, STORE AND FRAMES
+# --------------------------------------------
 
+# Defining the enviornment as a table
 class Env:
     """
     The Env class functions to bound identifiers to their corresponding values.
     It offers methods for searching for identifier bindings and adding new bindings.
+    Bindings are kept in a dictionary indexed by identifier, so a lookup takes the
+    same time however many names the frame binds.
     """
     
     def __init__(self):
-        self.s: list[Bind] = []
+        self.s: dict[Ide, Dval] = {}
 
     def applyEnv(self, ide: Ide) -> Dval | None:
         """
         Looks for a name "ide" in the enviornment
         """
-        i = len(self.s) - 1
-        while(i > -1 and self.s[i].identifier != ide):
-            i -= 1
-        if i > -1:
-            return self.s[i].value
-        else:
-            return None
+        return self.s.get(ide)
 
     def bind(self, ide: Ide, value: Dval):
         """
-        Adds a new pair (Identifier, Denotable value) to the enviornment
+        Adds a new pair (Identifier, Denotable value) to the enviornment. Binding a
+        name again replaces its previous binding: the latest one wins, as it shadows
+        the others for the rest of the frame.
         """
-        self.s.append(Bind(ide, value))
+        self.s[ide] = value
 
 # Definfing the store as a stack
 class Store:
@@ -356,6 +482,14 @@ class Frame:
     sto: Store
     slink: int
 
+# Number of popped frames kept by a FrameStack to be reused
+FRAME_POOL_SIZE = 64
+
+# A hook is called for every expression, command and declaration run, as
+# hook(run, node, frame_stack, heap, *out) instead of run(node, frame_stack, heap, *out),
+# and must call "run" itself and return what it returns (see interpret and profiler.py)
+Hook = Callable[..., object]
+
 class FrameStack:
     """
     The FrameStack class represents the stack of frames (environments and stores) used in 
@@ -367,6 +501,21 @@ class FrameStack:
         Initializes an empty frame
         """
         self.s: list[Frame] = []
+        self.pool: list[Frame] = []
+        self.hook: Hook | None = None
+
+    def new_frame(self, slink: int) -> Frame:
+        """
+        Returns an empty frame with the static link "slink", reusing the environment
+        and store of a popped frame when there is one
+        """
+        if self.pool:
+            f = self.pool.pop()
+            f.env.s.clear()
+            f.sto.s.clear()
+            f.slink = slink
+            return f
+        return Frame(Env(), Store(), slink)
 
     def push_frame(self, f: Frame):
         """
@@ -388,9 +537,19 @@ class FrameStack:
 
     def pop_frame(self) -> None:
         """
-        Removes a frame from the frame stack
+        Removes a frame from the frame stack. Nothing refers to a popped frame any
+        more (frames are referred to by index), so it is kept to be reused.
+        """
+        f = self.s.pop()
+        if len(self.pool) < FRAME_POOL_SIZE:
+            self.pool.append(f)
+
+    def pop_frames(self, n: int):
+        """
+        Removes frames from the frame stack until "n" are left
         """
-        self.s.pop()
+        while len(self.s) > n:
+            self.pop_frame()
 
     def current_frame_index(self) -> int:
         """
@@ -398,6 +557,15 @@ class FrameStack:
         """
         return len(self.s) - 1
 
+    def pointers(self) -> Iterable[int]:
+        """
+        Returns the heap locations held by the pointers in the stores of all the frames
+        """
+        for f in self.s:
+            for v in f.sto.s:
+                if type(v) is SPointer:
+                    yield v.v
+
     def search_name(self, i: Ide) -> Dval:
         """
         Returns the frame where an identifier "i" (name) is located
@@ -417,57 +585,324 @@ class FrameStack:
 # NEW STRUCTURE: HEAP
 # --------------------------------------------
 
-# Defining the heap as a list
+# Tags of the heap cells
+FREE = 0
+INT = 1
+BOOL = 2
+BIG_INT = 3
+
+# Largest and smallest integers that fit in a cell of the typed array
+CELL_MAX = 2**63 - 1
+CELL_MIN = -2**63
+
+# Bytes used by a cell: its value in the typed array and its tag
+CELL_BYTES = 9
+
+# After a garbage collection, the heap still grows if more than this share of it is in use
+GC_MAX_OCCUPANCY = 0.75
+
+@dataclass
+class HeapStats:
+    capacity: int
+    in_use: int
+    peak: int
+    allocations: int
+    frees: int
+    grows: int
+    fragmentation: float
+    collections: int
+    cells_reclaimed: int
+    bytes_reclaimed: int
+    gc_pause_total: float
+    gc_pause_max: float
+
+# Defining the heap as a typed array of cells
 class Heap:
     """
-    The Heap class represents a fixed-size heap structure for user-managed memory
-    storage. This heap manages memory cells where users can store heapable values 
-    (integers and booleans) in a controlled manner. The heap maintains a list 
-    of free cells, enabling efficient allocation and deallocation of memory. 
+    The Heap class represents a heap structure for user-managed memory storage. This
+    heap manages memory cells where users can store heapable values (integers and
+    booleans) in a controlled manner.
+
+    The cells are kept in a typed array of 64-bit integers, with a tag per cell saying
+    whether it is free or holds an integer or a boolean (integers that do not fit in
+    64 bits are kept aside in a dictionary). The heap starts with "size" cells and
+    doubles when it is full, up to "max_size" cells. Freed cells are kept in a stack
+    and reused first.
+
+    With "gc" set, the heap is garbage collected: when it is full, the cells that
+    no pointer of the running program refers to are freed (mark and sweep) before
+    growing. The program is found through "roots", a function returning the heap
+    locations held by pointer variables, set by the backend running the program.
+    Since collected cells are reused first, a program reading a pointer after
+    DestroyPointer may see a different cell than without garbage collection.
     """
-    
-    def __init__(self, size=100):
+
+    def __init__(self, size=100, max_size=1 << 24, gc=False):
         """
-        Initializes the heap to have a fixed-size of 100 (free and empty) cells
+        Initializes the heap with "size" free cells, which can grow up to "max_size" cells
         """
         self.size = size
-        self.cells = [None] * size
-        self.free_cells = list(range(size))
+        self.initial_size = size
+        self.max_size = max_size
+        self.values = array("q", bytes(8 * size))
+        self.tags = bytearray(size)
+        self.big_ints: dict[int, int] = {}
+        self.free_cells = array("q")
+        self.next_fresh = 0
+
+        # Usage statistics
+        self.in_use = 0
+        self.peak = 0
+        self.allocations = 0
+        self.frees = 0
+        self.grows = 0
+
+        # Garbage collection
+        self.gc = gc
+        self.roots: Callable[[], Iterable[int]] | None = None
+        self.collections = 0
+        self.cells_reclaimed = 0
+        self.gc_pause_total = 0.0
+        self.gc_pause_max = 0.0
+
+    def valid(self, loc: int) -> bool:
+        """
+        Returns whether "loc" is an allocated cell of the heap
+        """
+        return 0 <= loc < self.size and self.tags[loc] != FREE
 
-    def alloc(self, v: Hval) -> int:
+    def grow(self):
         """
-        If there are free cells in the heap, places "v" in the next free cell and returns that location
+        Doubles the number of cells of the heap, without going over "max_size"
         """
-        if not self.free_cells:
+        new_size = min(self.size * 2, self.max_size)
+        if new_size <= self.size:
             raise Exception("Heap is full. Heap overflow")
-        loc = self.free_cells.pop()
-        self.cells[loc] = v
+        self.values.frombytes(bytes(8 * (new_size - self.size)))
+        self.tags.extend(bytes(new_size - self.size))
+        self.size = new_size
+        self.grows += 1
+
+    def make_room(self):
+        """
+        Called when the heap is full: collects garbage if it can, and grows the heap
+        if that did not free enough cells. A heap that cannot grow any more only
+        overflows if the collection freed nothing.
+        """
+        if self.gc and self.roots is not None:
+            self.collect()
+            if self.free_cells and (self.in_use <= self.size * GC_MAX_OCCUPANCY or self.size >= self.max_size):
+                return
+        self.grow()
+
+    def collect(self) -> int:
+        """
+        Frees every allocated cell that is not pointed by the roots, and returns the
+        number of cells reclaimed
+        """
+        start = perf_counter()
+        marked = bytearray(self.size)
+        for loc in self.roots():
+            if 0 <= loc < self.size:
+                marked[loc] = 1
+
+        reclaimed = 0
+        tags = self.tags
+        for loc in range(self.next_fresh):
+            if tags[loc] != FREE and not marked[loc]:
+                if tags[loc] == BIG_INT:
+                    del self.big_ints[loc]
+                tags[loc] = FREE
+                self.free_cells.append(loc)
+                reclaimed += 1
+        self.in_use -= reclaimed
+
+        pause = perf_counter() - start
+        self.collections += 1
+        self.cells_reclaimed += reclaimed
+        self.gc_pause_total += pause
+        self.gc_pause_max = max(self.gc_pause_max, pause)
+        return reclaimed
+
+    def put(self, loc: int, v):
+        """
+        Writes the native integer or boolean "v" in the cell at location "loc"
+        """
+        if self.tags[loc] == BIG_INT:
+            del self.big_ints[loc]
+        if type(v) is bool:
+            self.tags[loc] = BOOL
+            self.values[loc] = v
+        elif type(v) is int and CELL_MIN <= v <= CELL_MAX:
+            self.tags[loc] = INT
+            self.values[loc] = v
+        elif type(v) is int:
+            self.tags[loc] = BIG_INT
+            self.big_ints[loc] = v
+        else:
+            raise Exception("Trying to convert a non-heapable type")
+
+    def alloc_native(self, v) -> int:
+        """
+        Places the native integer or boolean "v" in a free cell and returns its location.
+        The heap grows if it has no free cell left.
+        """
+        if not self.free_cells and self.next_fresh == self.size:
+            self.make_room()
+        if self.free_cells:
+            loc = self.free_cells.pop()
+        else:
+            loc = self.next_fresh
+            self.next_fresh += 1
+        self.put(loc, v)
+        self.allocations += 1
+        self.in_use += 1
+        if self.in_use > self.peak:
+            self.peak = self.in_use
         return loc
 
+    def apply_native(self, loc: int):
+        """
+        Returns the native integer or boolean stored at location "loc" of the heap
+        """
+        if not 0 <= loc < self.size:
+            raise Exception("Heap location is invalid")
+        tag = self.tags[loc]
+        if tag == INT:
+            return self.values[loc]
+        if tag == BOOL:
+            return self.values[loc] != 0
+        if tag == BIG_INT:
+            return self.big_ints[loc]
+        raise Exception("Heap location is invalid")
+
+    def update_native(self, loc: int, v):
+        """
+        Accesses location "loc" in the heap and changes its value to the native value "v"
+        """
+        if not self.valid(loc):
+            raise Exception("Heap location is invalid")
+        self.put(loc, v)
+
+    def alloc(self, v: Hval) -> int:
+        """
+        Places "v" in the next free cell and returns that location
+        """
+        return self.alloc_native(hval_to_native(v))
+
     def free(self, loc: int):
         """
         Frees the space at location "loc" of the heap
         """
-        if loc >= self.size or self.cells[loc] is None:
+        if not self.valid(loc):
             raise Exception("Heap location is invalid")
-        self.cells[loc] = None
+        if self.tags[loc] == BIG_INT:
+            del self.big_ints[loc]
+        self.tags[loc] = FREE
         self.free_cells.append(loc)
+        self.in_use -= 1
+        self.frees += 1
 
     def apply(self, loc: int) -> Hval:
         """
         Returns the value stored at location "loc" of the heap
         """
-        if loc >= self.size or self.cells[loc] is None:
-            raise Exception("Heap location is invalid")
-        return self.cells[loc]
+        return native_to_hval(self.apply_native(loc))
 
     def update(self, loc: int, v: Hval):
         """
         Accesses location "loc" in the heap and changes its value to "v"
         """
-        if loc >= self.size or self.cells[loc] is None:
-            raise Exception("Heap location is invalid")
-        self.cells[loc] = v
+        self.update_native(loc, hval_to_native(v))
+
+    def compact(self):
+        """
+        Gives back the free cells at the end of the heap, shrinking it down to the last
+        allocated cell (but not below its initial size). Allocated cells never move,
+        since pointers hold their locations.
+        """
+        while self.next_fresh > 0 and self.tags[self.next_fresh - 1] == FREE:
+            self.next_fresh -= 1
+        new_size = max(self.next_fresh, self.initial_size)
+        del self.values[new_size:]
+        del self.tags[new_size:]
+        self.size = new_size
+        self.free_cells = array("q", (loc for loc in range(self.next_fresh - 1, -1, -1) if self.tags[loc] == FREE))
+
+    def cells(self) -> dict[int, Hval]:
+        """
+        Returns the allocated cells of the heap and their values
+        """
+        return {loc: self.apply(loc) for loc in range(self.next_fresh) if self.tags[loc] != FREE}
+
+    def stats(self) -> HeapStats:
+        """
+        Returns the usage statistics of the heap. The fragmentation is the share of free
+        cells among the cells used so far (the ones below the first never used cell).
+        """
+        holes = self.next_fresh - self.in_use
+        fragmentation = holes / self.next_fresh if self.next_fresh else 0.0
+        return HeapStats(self.size, self.in_use, self.peak, self.allocations, self.frees, self.grows,
+                         fragmentation, self.collections, self.cells_reclaimed,
+                         self.cells_reclaimed * CELL_BYTES, self.gc_pause_total, self.gc_pause_max)
+
+# --------------------------------------------
+# OUTPUT
+# --------------------------------------------
+
+# Show writes the values it prints to an output sink instead of calling print
+# directly, which writes every value to the terminal on its own
+
+class BufferedOutput:
+    """
+    The BufferedOutput class writes the shown values to "stream" (the standard output
+    by default), one per line like print, "size" lines at a time. flush writes the
+    remaining lines: interpret calls it when the program ends, even on an error.
+    """
+
+    def __init__(self, stream=None, size: int = 4096):
+        self.stream = stream
+        self.size = size
+        self.lines: list[str] = []
+
+    def write(self, v: int | bool):
+        self.lines.append(f"{v}\n")
+        if len(self.lines) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            # The standard output is looked up when writing, so that it can be redirected
+            stream = self.stream if self.stream is not None else sys.stdout
+            stream.write("".join(self.lines))
+            self.lines.clear()
+
+class ListOutput:
+    """
+    The ListOutput class collects the shown values in a list
+    """
+
+    def __init__(self):
+        self.values: list[int | bool] = []
+
+    def write(self, v: int | bool):
+        self.values.append(v)
+
+    def flush(self):
+        pass
+
+class NullOutput:
+    """
+    The NullOutput class discards the shown values
+    """
+
+    def write(self, v: int | bool):
+        pass
+
+    def flush(self):
+        pass
+
+Output = BufferedOutput | ListOutput | NullOutput
 
 # --------------------------------------------
 # HELPER FUNCTIONS
@@ -508,6 +943,14 @@ def applyUnaryOperator(tpy: type[Eval], op, v1: Eval) -> Eval:
 # --------------------------------------------
 
 def sem(ex: Exp, frame_stack: FrameStack, heap: Heap) -> Eval:
+    """
+    Evaluates the expression "ex", through the hook of the frame stack if there is one
+    """
+    if frame_stack.hook is not None:
+        return frame_stack.hook(evaluate, ex, frame_stack, heap)
+    return evaluate(ex, frame_stack, heap)
+
+def evaluate(ex: Exp, frame_stack: FrameStack, heap: Heap) -> Eval:
     """
     This is the semantics of expressions. It will use recursion to evaluate the inner-expressions
     within any expressions.
@@ -519,15 +962,21 @@ def sem(ex: Exp, frame_stack: FrameStack, heap: Heap) -> Eval:
         case Plus(e1, e2):
             v1 = sem(e1, frame_stack, heap)
             v2 = sem(e2, frame_stack, heap)
+            if ex.checked:
+                return EInt(v1.v + v2.v)
             return applyBinOperator(EInt, lambda x, y: x + y, v1, v2)
 
         case Mult(e1, e2):
             v1 = sem(e1, frame_stack, heap)
             v2 = sem(e2, frame_stack, heap)
+            if ex.checked:
+                return EInt(v1.v * v2.v)
             return applyBinOperator(EInt, lambda x, y: x * y, v1, v2)
 
         case Minus(e):
             v1 = sem(e, frame_stack, heap)
+            if ex.checked:
+                return EInt(-v1.v)
             return applyUnaryOperator(EInt, lambda x: -x, v1)
 
         case Bool(b):
@@ -536,30 +985,36 @@ def sem(ex: Exp, frame_stack: FrameStack, heap: Heap) -> Eval:
         case And(e1, e2):
             v1 = sem(e1, frame_stack, heap)
             v2 = sem(e2, frame_stack, heap)
+            if ex.checked:
+                return EBool(v1.v and v2.v)
             return applyBinOperator(EBool, lambda x, y: x and y, v1, v2)
 
         case Or(e1, e2):
             v1 = sem(e1, frame_stack, heap)
             v2 = sem(e2, frame_stack, heap)
+            if ex.checked:
+                return EBool(v1.v or v2.v)
             return applyBinOperator(EBool, lambda x, y: x or y, v1, v2)
 
         case Not(e):
             v1 = sem(e, frame_stack, heap)
+            if ex.checked:
+                return EBool(not v1.v)
             return applyUnaryOperator(EBool, lambda x: not x, v1)
 
         case Equal(e1, e2):
             v1 = sem(e1, frame_stack, heap)
             v2 = sem(e2, frame_stack, heap)
             if v1 == v2:
-                return EBool(True)
+                return ETRUE
             else:
-                return EBool(False)
+                return EFALSE
 
         case If(c, e1, e2):
             vc = sem(c, frame_stack, heap)
-            if not typeCheck(EBool, vc):
+            if not ex.checked and not typeCheck(EBool, vc):
                 raise Exception("Non Boolean Condition in Conditional")
-            if vc == EBool(True):
+            if vc == ETRUE:
                 return sem(e1, frame_stack, heap)
             else:
                 return sem(e2, frame_stack, heap)
@@ -623,7 +1078,15 @@ def sem(ex: Exp, frame_stack: FrameStack, heap: Heap) -> Eval:
 # SEMANTICS OF COMMANDS
 # --------------------------------------------
         
-def semcom(c: Com, frame_stack: FrameStack, heap: Heap):
+def semcom(c: Com, frame_stack: FrameStack, heap: Heap, out: Output):
+    """
+    Executes the command "c", through the hook of the frame stack if there is one
+    """
+    if frame_stack.hook is not None:
+        return frame_stack.hook(execute, c, frame_stack, heap, out)
+    return execute(c, frame_stack, heap, out)
+
+def execute(c: Com, frame_stack: FrameStack, heap: Heap, out: Output):
     """
     This is the semantics of commands. It will use recursion to evaluate the inner-commands
     within any command.
@@ -664,15 +1127,16 @@ def semcom(c: Com, frame_stack: FrameStack, heap: Heap):
                     raise Exception("Identifier is not bound to a variable")
         
         case While(e, b):
-            if sem(e, frame_stack, heap) == EBool(True):
-                semcom(b, frame_stack, heap)
-                semcom(c, frame_stack, heap)
+            # Loop in Python instead of re-running semcom on the While itself, so that
+            # the number of iterations does not grow the Python stack
+            while sem(e, frame_stack, heap) == ETRUE:
+                semcom(b, frame_stack, heap, out)
                 
         case CIf(e, b1, b2):
-            if sem(e, frame_stack, heap) == EBool(True):
-                semcom(b1, frame_stack, heap)
+            if sem(e, frame_stack, heap) == ETRUE:
+                semcom(b1, frame_stack, heap, out)
             else:
-                semcom(b2, frame_stack, heap)
+                semcom(b2, frame_stack, heap, out)
 
     # NEW SEMANTICS FOR COMMANDS (PROCEDURES)
     
@@ -690,55 +1154,8 @@ def semcom(c: Com, frame_stack: FrameStack, heap: Heap):
 
                 # If we are dealing with a procedure, we continue
                 case DProc(formal_par, body, frame_n):
-                    new_store: Store = Store()
-                    new_env: Env = Env()
-
-                    vl: list[Sval] = []
-
-                    # Iterate through the actual parameters since pointers have to be handled differently
-                    for exp in actual_par:
-
-                        # Using eager evaluation here as the values of the actual parameters are immediately evaluated
-                        match exp:
-
-                            # Case where Val(x) exists meaning the actual parameter is a variable
-                            case Val(x):
-                                match x:
-
-                                    # If x is a pointer, just append the address its pointing to
-                                    case SPointer(address):
-                                        vl.append(SPointer(address))
-
-                                    # If x is not a pointer, evaluate its value and then append that
-                                    case Ide(varname):
-                                        dloc = frame_stack.search_name(varname)
-                                        match dloc:
-                                            case DLoc(location, frame_index):
-                                                sto = frame_stack.frame_at(frame_index).sto
-                                                val_at_loc = sto.apply(location)
-                                                vl.append(val_at_loc)
-                                            case _:
-                                                raise Exception ("Variable was not properly declared or accessible")
-                                            
-                                    # Raise an exception if x is not a pointer or a value
-                                    case _:
-                                        raise Exception ("Expected a variable")
-
-                            # Case without Val(x), we simply evaluate with "sem"
-                            case _:
-                                v = sem (exp, frame_stack, heap)
-                                vl.append(eval_to_sval(v))
-
-                    # Binding (assign) the actual parameters to the formal parameters (pass by value)
-                    bind_list: zip[tuple[Ide, Sval]] = zip(formal_par, vl)
-                    for (i, v) in bind_list:
-                        l = new_store.alloc(v)
-                        dloc = DLoc(l, frame_stack.current_frame_index() + 1)
-                        new_env.bind(i, dloc)
-                        
-                    frame_stack.push_frame(Frame(new_env, new_store, frame_n))
-                    semcomlist(body, frame_stack, heap)
-                    frame_stack.pop_frame()
+                    vl = semargs(actual_par, frame_stack, heap)
+                    semcall(dproc, vl, frame_stack, heap, out)
 
                 # If we are not dealing with a procedure we raise an exception
                 case _:
@@ -828,7 +1245,7 @@ def semcom(c: Com, frame_stack: FrameStack, heap: Heap):
                     raise Exception ("Identifier is not bound to a variable")
 
         case Block(dl, cl):
-            semblock(c, frame_stack, heap)
+            semblock(c, frame_stack, heap, out)
                     
         case Show(exp):
             # Prints expressible values. Can be used to print values of variables that are not pointers
@@ -837,30 +1254,161 @@ def semcom(c: Com, frame_stack: FrameStack, heap: Heap):
             
             match evaluation:
                 case EInt(n):
-                    print(n)
+                    out.write(n)
                 case EBool(b):
-                    print(b)
+                    out.write(b)
                 case _:
                     raise Exception("Not a printable value")
 
         case _:
             raise Exception ("Unknown command")
 
+# --------------------------------------------
+# SEMANTICS OF PROCEDURE CALLS
+# --------------------------------------------
+
+# A Call that is the last command of a procedure body (possibly inside the last
+# command of a Block, or a branch of a CIf, in that position) is a tail call: the
+# running call has nothing left to do once it returns. semtail evaluates such a call's
+# actual parameters and hands it back to semcall, which then drops the frames of the
+# running call and runs the new one in their place, in a loop, instead of nesting it.
+# Tail-recursive procedures thus run at constant Python stack depth.
+
+TAIL_COMMANDS = (Call, CIf, Block)
+
+def semargs(actual_par: list[Exp], frame_stack: FrameStack, heap: Heap) -> list[Sval]:
+    """
+    Evaluates the actual parameters of a call into the storable values bound to the formal parameters
+    """
+    vl: list[Sval] = []
+
+    # Iterate through the actual parameters since pointers have to be handled differently
+    for exp in actual_par:
+
+        # Using eager evaluation here as the values of the actual parameters are immediately evaluated
+        match exp:
+
+            # Case where Val(x) exists meaning the actual parameter is a variable
+            case Val(x):
+                match x:
+
+                    # If x is a pointer, just append the address its pointing to
+                    case SPointer(address):
+                        vl.append(SPointer(address))
+
+                    # If x is not a pointer, evaluate its value and then append that
+                    case Ide(varname):
+                        dloc = frame_stack.search_name(varname)
+                        match dloc:
+                            case DLoc(location, frame_index):
+                                sto = frame_stack.frame_at(frame_index).sto
+                                val_at_loc = sto.apply(location)
+                                vl.append(val_at_loc)
+                            case _:
+                                raise Exception ("Variable was not properly declared or accessible")
+                            
+                    # Raise an exception if x is not a pointer or a value
+                    case _:
+                        raise Exception ("Expected a variable")
+
+            # Case without Val(x), we simply evaluate with "sem"
+            case _:
+                v = sem (exp, frame_stack, heap)
+                vl.append(eval_to_sval(v))
+    return vl
+
+def semcall(dproc: DProc, vl: list[Sval], frame_stack: FrameStack, heap: Heap, out: Output):
+    """
+    Runs the procedure "dproc" with the actual parameter values "vl", and the tail calls it makes
+    """
+    base = len(frame_stack.s)
+    while True:
+        if len(dproc.parameters) != len(vl):
+            raise Exception("Wrong number of parameters")
+        f = frame_stack.new_frame(dproc.frame)
+
+        # Binding (assign) the actual parameters to the formal parameters (pass by value)
+        for (i, v) in zip(dproc.parameters, vl):
+            l = f.sto.alloc(v)
+            f.env.bind(i, DLoc(l, base))
+
+        frame_stack.push_frame(f)
+        tail = semtaillist(dproc.body, frame_stack, heap, out)
+        if tail is None:
+            break
+        (dproc, vl) = tail
+        if dproc.frame >= base:
+            # The procedure was declared during the running call, its static link is
+            # one of the frames that would be dropped: it is run as a normal call
+            semcall(dproc, vl, frame_stack, heap, out)
+            break
+        frame_stack.pop_frames(base)
+    frame_stack.pop_frames(base)
+
+def semtail(c: Com, frame_stack: FrameStack, heap: Heap, out: Output) -> tuple[DProc, list[Sval]] | None:
+    """
+    Executes the command "c" in tail position, through the hook of the frame stack if there is one
+    """
+    if frame_stack.hook is not None:
+        return frame_stack.hook(execute_tail, c, frame_stack, heap, out)
+    return execute_tail(c, frame_stack, heap, out)
+
+def execute_tail(c: Com, frame_stack: FrameStack, heap: Heap, out: Output) -> tuple[DProc, list[Sval]] | None:
+    """
+    Executes a Call, CIf or Block in tail position. Returns the procedure and the actual
+    parameter values of the tail call reached, if any, without running it. The frames
+    of the Blocks entered are left on the frame stack, semcall drops them.
+    """
+    match c:
+        case Call(i, actual_par):
+            dproc: Dval = frame_stack.search_name(i)
+            match dproc:
+                case DProc(_, _, _):
+                    return (dproc, semargs(actual_par, frame_stack, heap))
+                case _:
+                    raise Exception("Attempting to call a non-callable value")
+
+        case CIf(e, b1, b2):
+            b = b1 if sem(e, frame_stack, heap) == ETRUE else b2
+            if type(b) in TAIL_COMMANDS:
+                return semtail(b, frame_stack, heap, out)
+            semcom(b, frame_stack, heap, out)
+            return None
+
+        case Block(dl, cl):
+            frame_stack.push_frame(frame_stack.new_frame(frame_stack.current_frame_index()))
+            semdecl(dl, frame_stack, heap)
+            return semtaillist(cl, frame_stack, heap, out)
+
+def semtaillist(cl: list[Com], frame_stack: FrameStack, heap: Heap, out: Output) -> tuple[DProc, list[Sval]] | None:
+    """
+    Executes a list of commands, the last one in tail position
+    """
+    if not cl:
+        return None
+    for k in range(len(cl) - 1):
+        semcom(cl[k], frame_stack, heap, out)
+    last = cl[-1]
+    if type(last) in TAIL_COMMANDS:
+        return semtail(last, frame_stack, heap, out)
+    semcom(last, frame_stack, heap, out)
+    return None
+
 # --------------------------------------------
 # OTHER SEMANTICS
 # --------------------------------------------
 
-def semblock(block: Block, frame_stack: FrameStack, heap: Heap):
+def semblock(block: Block, frame_stack: FrameStack, heap: Heap, out: Output):
     """
     Semantics of blocks. Uses semantics of declarations and of list of commands
     to fully evaluate blocks
     """
     match block:
         case Block(dl, cl):
-            f = Frame(Env(), Store(), frame_stack.current_frame_index())
+            f = frame_stack.new_frame(frame_stack.current_frame_index())
             frame_stack.push_frame(f)
             semdecl(dl, frame_stack, heap)
-            semcomlist(cl, frame_stack, heap)
+            semcomlist(cl, frame_stack, heap, out)
             frame_stack.pop_frame()
         case _:
             raise Exception("Block Expected")
@@ -869,35 +1417,53 @@ def semdecl(dl: list[Decl], frame_stack: FrameStack, heap: Heap):
     """
     Semantics of declarations. Used to evaluate variable declarations in the
     current frame by binding a variable name to the value computed from a
-    given expression
+    given expression. Every declaration goes through the hook of the frame stack if
+    there is one.
     """
-    top: Frame = frame_stack.top_frame()
-    env: Env = top.env
-    sto: Store = top.sto
-
+    hook = frame_stack.hook
     for d in dl:
-        match d:
-            case Decl(i, e):
-                v = sem(e, frame_stack, heap)
-                l = sto.alloc(eval_to_sval(v))
-                env.bind(i, DLoc(l, frame_stack.current_frame_index()))
-            case _:
-                raise Exception("Invalid Declaration")
+        if hook is not None:
+            hook(declare, d, frame_stack, heap)
+        else:
+            declare(d, frame_stack, heap)
+
+def declare(d: Decl, frame_stack: FrameStack, heap: Heap):
+    """
+    Semantics of a single declaration
+    """
+    top: Frame = frame_stack.top_frame()
+    match d:
+        case Decl(i, e):
+            v = sem(e, frame_stack, heap)
+            l = top.sto.alloc(eval_to_sval(v))
+            top.env.bind(i, DLoc(l, frame_stack.current_frame_index()))
+        case _:
+            raise Exception("Invalid Declaration")
 
-def semcomlist(cl: list[Com], frame_stack: FrameStack, heap: Heap):
+def semcomlist(cl: list[Com], frame_stack: FrameStack, heap: Heap, out: Output):
     """
     Executes the semantics of a list of commands (iteratively calls cemcom)
     """
     for c in cl:
-        semcom(c, frame_stack, heap)
+        semcom(c, frame_stack, heap, out)
 
-def interpret(c: Com):
+def interpret(c: Com, heap: Heap | None = None, out: Output | None = None, hook: Hook | None = None):
     """
-    Interprets the command "c", creates a new frame and heap
+    Interprets the command "c", creates a new frame and heap (unless a heap is given).
+    Shown values are written to "out", by default to the standard output through a buffer.
+    Every node run goes through "hook" if one is given (see Hook).
     """
     frame_stack = FrameStack()
-    heap = Heap()
-    semcom(c, frame_stack, heap)
+    frame_stack.hook = hook
+    if heap is None:
+        heap = Heap()
+    if out is None:
+        out = BufferedOutput()
+    heap.roots = frame_stack.pointers
+    try:
+        semcom(c, frame_stack, heap, out)
+    finally:
+        out.flush()
 
 # --------------------------------------------
 # TESTING
@@ -0,0 +1,46 @@
+"""
+BACKENDS
+
+The ways a program can be executed, selectable by name:
+
+    tree      - interpret, the tree-walking semantics of Interpreter.py
+    closures  - interpret_compiled, the closure compiler of compiler.py
+    vm        - interpret_vm, the bytecode virtual machine of vm.py
+
+Any of them can be preceded by the optimizer of optimizer.py and by the type checker
+of typechecker.py.
+"""
+
+from Interpreter import Com, Heap, Output, interpret
+from compiler import interpret_compiled
+from vm import interpret_vm
+from optimizer import optimize
+from typechecker import check
+
+BACKENDS = {
+    "tree": interpret,
+    "closures": interpret_compiled,
+    "vm": interpret_vm,
+}
+
+def run(c: Com, backend: str = "tree", optimized: bool = False, resolved: bool = False, typed: bool = False,
+        out: Output | None = None, heap: Heap | None = None):
+    """
+    Runs the command "c" with the backend called "backend", optimizing it first if
+    "optimized" is set and type checking it if "typed" is set. A "resolved" command
+    (see resolver.py) is not resolved again. Shown values are written to "out", by
+    default to the standard output, and pointers use "heap", by default a new one.
+    """
+    if backend not in BACKENDS:
+        raise Exception(f"Unknown backend {backend}, expected one of: {', '.join(BACKENDS)}")
+    if optimized:
+        (c, _) = optimize(c)
+        resolved = False
+    if typed:
+        c = check(c, resolved)
+        resolved = True
+    if resolved and backend != "tree":
+        # interpret ignores the resolver annotations
+        BACKENDS[backend](c, heap, resolved=True, out=out)
+    else:
+        BACKENDS[backend](c, heap, out=out)
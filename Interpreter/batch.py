@@ -0,0 +1,184 @@
+"""
+BATCH RUNNER
+
+Runs many programs (source files in the syntax of parser.py) in parallel, one per
+worker process of a pool, and prints a table of the results:
+
+    python batch.py tests/                      every *.txt file of the directory
+    python batch.py a.txt b.txt --timeout 5 --memory 512 --workers 8 --json results.json
+
+The output of Show is captured for every program instead of being printed. A program
+running longer than the timeout (in seconds) is stopped (on systems with
+signal.setitimer, elsewhere programs run without a timeout), and the memory of a
+worker is limited to the given number of megabytes (on systems with the resource
+module): a program needing more fails with a memory error, without stopping the batch.
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from Interpreter import BufferedOutput
+from backends import BACKENDS, run
+from parser import load
+
+@dataclass
+class BatchResult:
+    program: str
+    status: str             # "ok", "error", "timeout" or "memory"
+    elapsed: float
+    output: str
+    error: str | None = None
+
+class Timeout(Exception):
+    pass
+
+# Timeouts need an interval timer sending SIGALRM, which only POSIX systems have
+TIMER = hasattr(signal, "setitimer")
+
+# --------------------------------------------
+# WORKERS
+# --------------------------------------------
+
+def limit_memory(megabytes: int | None):
+    """
+    Limits the address space of the current process. Run once by every worker.
+    """
+    if megabytes is not None and resource is not None:
+        limit = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+
+# Whether the running program can still be stopped. Cleared as soon as it is done, so
+# that an alarm delivered just after that does not interrupt the cleanup.
+alarm_armed = False
+
+def on_timeout(signum, frame):
+    if alarm_armed:
+        raise Timeout()
+
+def arm_timer(timeout: float):
+    """
+    Stops the running program with a Timeout once "timeout" seconds have passed
+    """
+    global alarm_armed
+    signal.signal(signal.SIGALRM, on_timeout)
+    alarm_armed = True
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+
+def disarm_timer():
+    global alarm_armed
+    alarm_armed = False
+    signal.setitimer(signal.ITIMER_REAL, 0)
+
+def run_program(path: str, backend: str = "tree", timeout: float | None = None) -> BatchResult:
+    """
+    Loads and runs one program, capturing its output. Errors (of the program, of its
+    source, or timeouts) are reported in the result instead of being raised.
+    """
+    output = io.StringIO()
+    out = BufferedOutput(output)
+    status = "ok"
+    error = None
+    timed = timeout is not None and TIMER
+    start = perf_counter()
+    try:
+        if timed:
+            arm_timer(timeout)
+        try:
+            run(load(path), backend, out=out)
+        finally:
+            if timed:
+                disarm_timer()
+    except Timeout:
+        (status, error) = ("timeout", f"Stopped after {timeout} s")
+    except MemoryError:
+        (status, error) = ("memory", "Out of memory")
+    except RecursionError:
+        (status, error) = ("error", "Maximum recursion depth exceeded")
+    except Exception as e:
+        (status, error) = ("error", str(e))
+    finally:
+        out.flush()
+    return BatchResult(path, status, perf_counter() - start, output.getvalue(), error)
+
+# --------------------------------------------
+# BATCHES
+# --------------------------------------------
+
+def find_programs(paths: list[str], pattern: str = "*.txt") -> list[str]:
+    """
+    Returns the given source files, directories being replaced by the files in them
+    matching "pattern"
+    """
+    programs = []
+    for path in paths:
+        if os.path.isdir(path):
+            programs.extend(sorted(glob.glob(os.path.join(path, pattern))))
+        else:
+            programs.append(path)
+    return programs
+
+def run_batch(programs: list[str], backend: str = "tree", workers: int | None = None,
+              timeout: float | None = None, memory: int | None = None) -> list[BatchResult]:
+    """
+    Runs the programs on a pool of "workers" processes (one per core by default) and
+    returns their results, in the order of "programs"
+    """
+    if backend not in BACKENDS:
+        raise Exception(f"Unknown backend {backend}, expected one of: {', '.join(BACKENDS)}")
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(programs) // (4 * workers))
+    with ProcessPoolExecutor(workers, initializer=limit_memory, initargs=(memory,)) as pool:
+        return list(pool.map(run_program, programs, [backend] * len(programs),
+                             [timeout] * len(programs), chunksize=chunksize))
+
+def format_table(results: list[BatchResult]) -> str:
+    """
+    Returns a table of the results, one line per program, and a summary
+    """
+    width = max([len("program")] + [len(r.program) for r in results])
+    lines = [f"{'program':<{width}} {'status':<8} {'time (s)':>9}  error"]
+    for r in results:
+        lines.append(f"{r.program:<{width}} {r.status:<8} {r.elapsed:9.3f}  {r.error or ''}")
+    counts = {}
+    for r in results:
+        counts[r.status] = counts.get(r.status, 0) + 1
+    lines.append("")
+    lines.append(f"{len(results)} programs: " + ", ".join(f"{n} {status}" for (status, n) in counts.items())
+                 + f", {sum(r.elapsed for r in results):.3f} s in total")
+    return "\n".join(lines)
+
+def main(argv: list[str] | None = None):
+    arguments = argparse.ArgumentParser(description="Runs many programs of the Interpreter language in parallel")
+    arguments.add_argument("paths", nargs="+", help="source files, or directories of source files")
+    arguments.add_argument("--pattern", default="*.txt", help="source files to run in directories (default: *.txt)")
+    arguments.add_argument("--backend", choices=BACKENDS, default="tree", help="how to execute the programs (default: tree)")
+    arguments.add_argument("--workers", type=int, help="number of worker processes (default: one per core)")
+    arguments.add_argument("--timeout", type=float, help="seconds after which a program is stopped (POSIX systems only)")
+    arguments.add_argument("--memory", type=int, help="megabytes of memory of every worker")
+    arguments.add_argument("--json", help="also write the results, outputs included, to this file")
+    args = arguments.parse_args(argv)
+
+    programs = find_programs(args.paths, args.pattern)
+    if not programs:
+        sys.exit("No programs to run")
+    results = run_batch(programs, args.backend, args.workers, args.timeout, args.memory)
+    print(format_table(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+if __name__ == "__main__":
+    main()
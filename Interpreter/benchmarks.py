@@ -0,0 +1,314 @@
+"""
+BENCHMARKS
+
+Timings of the interpreter on larger programs than the ones in the TESTING section
+of Interpreter.py. Run with:
+
+    python benchmarks.py
+"""
+
+import os
+import time
+import tracemalloc
+from dataclasses import field, fields, is_dataclass, make_dataclass
+
+import Interpreter
+from Interpreter import (
+    Int, Plus, Not, Equal, Val, Assign, While, CIf, Block, Show, Decl, NewPointer, Procedure, Call, Com, Heap,
+    BufferedOutput, ListOutput, NullOutput,
+)
+from backends import BACKENDS
+from compiler import CallCache, interpret_compiled
+from optimizer import count_nodes
+import vm
+from parser import parse, unparse
+
+# --------------------------------------------
+# PROGRAMS
+# --------------------------------------------
+
+def counter_loop(n: int) -> Com:
+    """
+    Builds a program counting from 0 to "n" in a While loop and showing the result
+    """
+    return Block(
+        [Decl("i", Int(0))],
+        [
+            While(Not(Equal(Val("i"), Int(n))),
+                Assign("i", Plus(Val("i"), Int(1)))
+            ),
+            Show(Val("i"))
+        ]
+    )
+
+def nested_lookup(depth: int, width: int, n: int) -> Com:
+    """
+    Builds "depth" nested blocks declaring "width" variables each, with a loop of "n"
+    iterations in the innermost block updating a variable of the outermost one
+    """
+    c: Com = While(Not(Equal(Val("i"), Int(n))),
+        Assign("i", Plus(Val("i"), Int(1)))
+    )
+    for d in range(depth):
+        c = Block([Decl(f"v{d}_{k}", Int(k)) for k in range(width)], [c])
+    return Block([Decl("i", Int(0))], [c, Show(Val("i"))])
+
+def wide_block(width: int, n: int) -> Com:
+    """
+    Builds a block declaring "width" variables, each one from an earlier one, with a
+    loop of "n" iterations on the first variable declared
+    """
+    declarations = [Decl("i", Int(0))]
+    declarations += [Decl(f"v{k}", Plus(Val(f"v{k // 2}" if k > 0 else "i"), Int(1))) for k in range(width)]
+    return Block(
+        declarations,
+        [
+            While(Not(Equal(Val("i"), Int(n))),
+                Assign("i", Plus(Val("i"), Int(1)))
+            ),
+            Show(Val(f"v{width - 1}"))
+        ]
+    )
+
+def pointer_loop(n: int) -> Com:
+    """
+    Builds a program allocating a new pointer on every one of its "n" iterations,
+    without ever destroying them
+    """
+    return Block(
+        [Decl("i", Int(0))],
+        [
+            While(Not(Equal(Val("i"), Int(n))),
+                Block([], [
+                    NewPointer("p", Val("i")),
+                    Assign("i", Plus(Val("i"), Int(1)))
+                ])
+            ),
+            Show(Val("i"))
+        ]
+    )
+
+def helper_loop(n: int, k: int) -> Com:
+    """
+    Builds a program calling, on every one of its "n" iterations, a pure procedure
+    counting to "k" in a local variable
+    """
+    return Block(
+        [Decl("i", Int(0))],
+        [
+            Procedure("helper", ["k"], [
+                Block([Decl("j", Int(0))], [
+                    While(Not(Equal(Val("j"), Val("k"))),
+                        Assign("j", Plus(Val("j"), Int(1)))
+                    )
+                ])
+            ]),
+            While(Not(Equal(Val("i"), Int(n))),
+                Block([], [
+                    Call("helper", [Int(k)]),
+                    Assign("i", Plus(Val("i"), Int(1)))
+                ])
+            ),
+            Show(Val("i"))
+        ]
+    )
+
+def show_loop(n: int) -> Com:
+    """
+    Builds a program showing every number from 0 to "n" - 1
+    """
+    return Block(
+        [Decl("i", Int(0))],
+        [
+            While(Not(Equal(Val("i"), Int(n))),
+                Block([], [
+                    Show(Val("i")),
+                    Assign("i", Plus(Val("i"), Int(1)))
+                ])
+            )
+        ]
+    )
+
+def countdown(n: int) -> Com:
+    """
+    Builds a program with a procedure calling itself "n" times, as its last command
+    """
+    return Block(
+        [],
+        [
+            Procedure("countdown", ["n"], [
+                CIf(Equal(Val("n"), Int(0)),
+                    Show(Val("n")),
+                    Call("countdown", [Plus(Val("n"), Int(-1))])
+                )
+            ]),
+            Call("countdown", [Int(n)])
+        ]
+    )
+
+# --------------------------------------------
+# BENCHMARKS
+# --------------------------------------------
+
+def timed(label: str, run, c: Com) -> float:
+    """
+    Runs "c" with the given interpreter function and prints the elapsed time
+    """
+    start = time.perf_counter()
+    run(c)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<45} {elapsed:8.3f} s")
+    return elapsed
+
+def bench_counter_loop(n: int = 1_000_000):
+    """
+    A loop of "n" iterations. Used to show that While runs at constant Python stack depth.
+    """
+    c = counter_loop(n)
+    for (backend, run) in BACKENDS.items():
+        timed(f"counter loop ({n}) {backend}", run, c)
+
+def bench_nested_lookup(depth: int = 20, width: int = 50, n: int = 20_000):
+    """
+    Name lookups through many frames with many bindings each
+    """
+    c = nested_lookup(depth, width, n)
+    for (backend, run) in BACKENDS.items():
+        timed(f"nested lookup ({depth}x{width}) {backend}", run, c)
+
+def bench_wide_block(widths: tuple[int, ...] = (1_000, 2_000, 4_000), n: int = 10_000):
+    """
+    Name lookups in a single frame binding thousands of names
+    """
+    for width in widths:
+        c = wide_block(width, n)
+        for (backend, run) in BACKENDS.items():
+            timed(f"wide block ({width}) {backend}", run, c)
+
+def bench_pointer_loop(n: int = 100_000):
+    """
+    Heap allocations far beyond the initial 100 cells of the heap
+    """
+    c = pointer_loop(n)
+    for (backend, run) in BACKENDS.items():
+        heap = Heap()
+        timed(f"pointer loop ({n}) {backend}", lambda c: run(c, heap), c)
+        print(heap.stats())
+    for backend in ("tree", "vm"):
+        heap = Heap(gc=True)
+        timed(f"pointer loop ({n}) {backend} with gc", lambda c: BACKENDS[backend](c, heap), c)
+        print(heap.stats())
+    print("pointer loop with gc: not run on closures, which never collects (it does not set heap.roots)")
+
+def bench_helper_loop(n: int = 10_000, k: int = 100):
+    """
+    Repeated calls of a pure procedure with the same actual parameter, with and without memoization
+    """
+    c = helper_loop(n, k)
+    for (backend, run) in BACKENDS.items():
+        timed(f"helper loop ({n}x{k}) {backend}", run, c)
+    cache = CallCache()
+    timed(f"helper loop ({n}x{k}) closures memoized", lambda c: interpret_compiled(c, cache=cache), c)
+    print(f"{cache.hits} hits, {cache.misses} misses")
+
+def bench_loading(width: int = 100_000):
+    """
+    Loading the source of a program with "width" declarations, with parse and with eval
+    """
+    source = unparse(nested_lookup(1, width, 1))
+    print(f"source of {len(source)} characters")
+    timed("loading with parse", parse, source)
+    timed("loading with eval", lambda source: eval(source, vars(Interpreter)), source)
+
+def unslotted(cls: type) -> type:
+    """
+    Returns a copy of a syntax node class without slots, as the nodes were before they
+    were slotted: every instance has its own __dict__
+    """
+    return make_dataclass(cls.__name__, [(f.name, f.type, field(default=f.default, kw_only=f.kw_only))
+                                         for f in fields(cls)])
+
+def rebuild(node, classes: dict[type, type]):
+    """
+    Returns a copy of a syntax tree made of the given classes, sharing its names and constants
+    """
+    if isinstance(node, list):
+        return [rebuild(n, classes) for n in node]
+    if not is_dataclass(node):
+        return node
+    cls = type(node)
+    if cls not in classes:
+        classes[cls] = unslotted(cls)
+    return classes[cls](**{f.name: rebuild(getattr(node, f.name), classes) for f in fields(node)})
+
+def bench_node_memory(width: int = 100_000):
+    """
+    Memory taken by the syntax tree of a program with "width" declarations, per node, with
+    the slotted nodes and with a copy of them without slots
+    """
+    c = nested_lookup(1, width, 1)
+    nodes = count_nodes(c)
+    slotted = {cls: cls for cls in vars(Interpreter).values() if isinstance(cls, type) and is_dataclass(cls)}
+    # Both copies are made the same way, so they share the names and constants of "c"
+    for (label, classes) in [("slotted", slotted), ("not slotted", {})]:
+        tracemalloc.start()
+        copy = rebuild(c, classes)
+        (size, _) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{nodes} nodes {label}, {size / nodes:.1f} bytes per node")
+        del copy
+
+def bench_show_loop(n: int = 100_000):
+    """
+    A program showing "n" values, written to a line-buffered stream (like a terminal)
+    one line at a time as print does, through a buffer, or not written at all
+    """
+    c = show_loop(n)
+    with open(os.devnull, "w", buffering=1) as stream:
+        for (backend, run) in BACKENDS.items():
+            outputs = [
+                ("line by line", BufferedOutput(stream, size=1)),
+                ("buffered", BufferedOutput(stream)),
+                ("list", ListOutput()),
+                ("null", NullOutput()),
+            ]
+            for (label, out) in outputs:
+                timed(f"show loop ({n}) {backend} {label}", lambda c: run(c, out=out), c)
+
+def bench_countdown(n: int = 100_000):
+    """
+    Tail recursion "n" calls deep, far beyond the Python recursion limit
+    """
+    c = countdown(n)
+    for (backend, run) in BACKENDS.items():
+        try:
+            timed(f"countdown ({n}) {backend}", run, c)
+        except RecursionError:
+            print(f"countdown ({n}) {backend}: maximum recursion depth exceeded")
+
+def bench_time_slicing(n: int = 200_000, programs: int = 10, steps: int = 1_000):
+    """
+    Several programs run in turn on the VM, "steps" steps at a time, against the same
+    programs run one after the other
+    """
+    c = counter_loop(n)
+    def sequential(c):
+        for _ in range(programs):
+            vm.start(c, out=NullOutput()).run()
+    def sliced(c):
+        for _ in vm.round_robin([vm.start(c, out=NullOutput()) for _ in range(programs)], steps):
+            pass
+    timed(f"{programs} x counter loop ({n}) vm", sequential, c)
+    timed(f"{programs} x counter loop ({n}) vm by {steps} steps", sliced, c)
+
+if __name__ == "__main__":
+    bench_counter_loop()
+    bench_nested_lookup()
+    bench_wide_block()
+    bench_pointer_loop()
+    bench_helper_loop()
+    bench_loading()
+    bench_node_memory()
+    bench_show_loop()
+    bench_countdown()
+    bench_time_slicing()
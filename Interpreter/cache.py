@@ -0,0 +1,102 @@
+"""
+PROGRAM CACHE
+
+Keeps programs ready to run between executions. The first time a source file is
+loaded, it is parsed, optionally optimized and resolved (which checks that every name
+is declared), and the resulting tree is saved in a binary file next to the source:
+
+    program.txt  ->  program.txt.cache  (program.txt.opt.cache when optimized)
+
+The next loads read that file back instead of parsing and resolving again, as long as
+the source has not changed: the cache holds a SHA-256 hash of the source it was built
+from, and a cache whose hash (or format version) does not match is rebuilt.
+
+    c = load_cached("program.txt")
+    run(c, "vm", resolved=True)
+
+The cache files are pickles, and reading a pickle can run arbitrary code: anyone who
+can write in the directory of a source file can make a run using its cache execute
+their code. Only use the cache for programs in directories you trust.
+"""
+
+import hashlib
+import os
+import pickle
+from dataclasses import dataclass
+
+from Interpreter import Com
+from optimizer import optimize
+from parser import parse
+from resolver import resolve
+
+# Changed whenever the syntax tree or the resolver annotations change
+VERSION = 4
+
+@dataclass
+class CachedProgram:
+    version: int
+    source_hash: str
+    optimized: bool
+    program: Com
+
+def cache_path(path: str, optimized: bool) -> str:
+    """
+    Returns the path of the cache of the source file at "path"
+    """
+    return path + (".opt.cache" if optimized else ".cache")
+
+def build(source: bytes, optimized: bool) -> Com:
+    """
+    Parses, optimizes if "optimized" is set, and resolves a program
+    """
+    c = parse(source.decode())
+    if optimized:
+        (c, _) = optimize(c)
+    return resolve(c)
+
+def read_cache(path: str) -> CachedProgram | None:
+    """
+    Returns the cached program saved at "path", or None if there is none that can be read
+    """
+    try:
+        with open(path, "rb") as f:
+            cached = pickle.load(f)
+        if not isinstance(cached, CachedProgram) or cached.version != VERSION:
+            return None
+        # Checking the fields, which a damaged pickle may have left out
+        (cached.source_hash, cached.optimized, cached.program)
+    except Exception:
+        # A damaged pickle can fail in many ways (ValueError, TypeError, MemoryError...),
+        # the program is then built again
+        return None
+    return cached
+
+def write_cache(path: str, cached: CachedProgram):
+    """
+    Saves a cached program at "path". The file is written under another name first, so
+    that a run reading the cache at the same time never sees half of it.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except OSError:
+        # Not being able to cache a program (read-only directory...) only makes the next run slower
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+def load_cached(path: str, optimized: bool = False) -> Com:
+    """
+    Returns the resolved (and optimized if "optimized" is set) program of the source file
+    at "path", from its cache when the cache is up to date
+    """
+    with open(path, "rb") as f:
+        source = f.read()
+    source_hash = hashlib.sha256(source).hexdigest()
+    cached = read_cache(cache_path(path, optimized))
+    if cached is not None and cached.source_hash == source_hash and cached.optimized == optimized:
+        return cached.program
+    c = build(source, optimized)
+    write_cache(cache_path(path, optimized), CachedProgram(VERSION, source_hash, optimized, c))
+    return c
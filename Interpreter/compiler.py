@@ -0,0 +1,652 @@
+"""
+CLOSURE COMPILER
+
+Translates a Com/Exp tree (see Interpreter.py) once into a tree of Python closures,
+so that running the program no longer goes through the "match" statements of sem
+and semcom every time a node is visited.
+
+The program is resolved first (see resolver.py), so identifiers are compiled to
+indexed loads instead of FrameStack.search_name. A frame is a Python list: slot 0
+holds the frame of the static link and the following slots hold the storable values
+(or compiled procedures) bound in the frame, None while a name is not bound yet.
+Every compiled node is a function taking the current frame and the heap:
+
+    compile_exp(ex)            -> fn(frame, heap) -> int | bool
+    compile_com(c, cache, out) -> fn(frame, heap) -> None
+
+Values are native (see NATIVE VALUES in Interpreter.py): expressions return plain
+ints and bools and frames hold ints, bools and Pointers, so no EInt/SInt wrapper is
+built while running. The heap is accessed through its native methods as well.
+
+The compiled program has the same observable behaviour as interpret (same output,
+same heap, same exceptions).
+
+Calls to pure procedures can optionally be memoized, see MEMOIZATION below.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from operator import add, mul, and_, or_
+from typing import Callable
+
+from Interpreter import (
+    Int, Plus, Mult, Minus, Bool, And, Or, Not, Equal, If, Deref, Val,
+    Assign, While, CIf, Procedure, Call, NewPointer, DestroyPointer, UpdatePointerVal, Block, Show,
+    Decl, Exp, Com, Address,
+    Pointer,
+    Heap,
+    Output, BufferedOutput,
+)
+from resolver import resolve
+
+CompiledExp = Callable[[list, Heap], int | bool]
+CompiledCom = Callable[[list, Heap], None]
+
+# Compiled procedures carry their compiled body and the frame they were declared in.
+# They are compared by identity, so that they can be used in the keys of a CallCache.
+@dataclass(eq=False)
+class CProc:
+    param_slots: tuple[int, ...]
+    size: int
+    body: CompiledCom
+    frame: list
+    pure: bool = False
+
+class CallCache:
+    """
+    The CallCache class remembers the calls to pure procedures (a procedure and the
+    values of its actual parameters) that completed, keeping at most "size" of them and
+    dropping the least recently used one first.
+    """
+
+    def __init__(self, size: int = 1024):
+        self.size = size
+        self.calls: OrderedDict[tuple, None] = OrderedDict()
+        self.tainted = False
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: tuple) -> bool:
+        if key in self.calls:
+            self.calls.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, key: tuple):
+        self.calls[key] = None
+        if len(self.calls) > self.size:
+            self.calls.popitem(last=False)
+
+    def clear(self):
+        self.calls.clear()
+
+# --------------------------------------------
+# HELPER FUNCTIONS
+# --------------------------------------------
+
+def fail(message: str):
+    """
+    Returns a closure raising "message" when it is run. Used for nodes that the
+    tree-walking interpreter only rejects once they are executed.
+    """
+    def run(frame, heap):
+        raise Exception(message)
+    return run
+
+def compile_lookup(addr: Address) -> Callable[[list], tuple[list, int]]:
+    """
+    Compiles a resolved identifier into a closure returning the frame and slot it is bound in
+    """
+    if len(addr) == 1:
+        ((depth, slot),) = addr
+        if depth == 0:
+            return lambda frame: (frame, slot)
+        if depth == 1:
+            return lambda frame: (frame[0], slot)
+
+        def find(frame):
+            for _ in range(depth):
+                frame = frame[0]
+            return (frame, slot)
+        return find
+
+    # Several frames may bind the name, the innermost one bound at run time wins
+    candidates = tuple(a for a in addr if a is not None)
+
+    def find(frame):
+        for (depth, slot) in candidates:
+            f = frame
+            for _ in range(depth):
+                f = f[0]
+            if f[slot] is not None:
+                return (f, slot)
+        raise Exception("Name Not Found")
+    return find
+
+def compile_load(addr: Address) -> Callable[[list], object]:
+    """
+    Compiles a resolved identifier into a closure returning the value it is bound to
+    """
+    if len(addr) == 1:
+        ((depth, slot),) = addr
+        if depth == 0:
+            return lambda frame: frame[slot]
+        if depth == 1:
+            return lambda frame: frame[0][slot]
+        if depth == 2:
+            return lambda frame: frame[0][0][slot]
+    find = compile_lookup(addr)
+
+    def load(frame):
+        (f, slot) = find(frame)
+        return f[slot]
+    return load
+
+def compile_load_variable(addr: Address) -> Callable[[list], object]:
+    """
+    Compiles a resolved identifier into a closure returning the storable value of the variable
+    """
+    load = compile_load(addr)
+
+    def load_variable(frame):
+        v = load(frame)
+        if type(v) is CProc:
+            raise Exception("Identifier is not bound to a variable")
+        return v
+    return load_variable
+
+def compile_load_pointer(addr: Address) -> Callable[[list], int]:
+    """
+    Compiles a resolved identifier into a closure returning the heap location of the pointer variable
+    """
+    load_variable = compile_load_variable(addr)
+
+    def load_pointer(frame):
+        v = load_variable(frame)
+        if type(v) is not Pointer:
+            raise Exception("Variable does not contain a pointer")
+        return v.loc
+    return load_pointer
+
+# --------------------------------------------
+# COMPILATION OF EXPRESSIONS
+# --------------------------------------------
+
+def compile_exp(ex: Exp) -> CompiledExp:
+    """
+    Compiles a resolved expression into a closure returning its native value
+    """
+    match ex:
+        case Int(n):
+            def run(frame, heap):
+                return n
+            return run
+
+        case Bool(b):
+            b = bool(b)
+            def run(frame, heap):
+                return b
+            return run
+
+        case Plus(e1, e2):
+            return compile_binary_op(e1, e2, int, add, ex.checked)
+
+        case Mult(e1, e2):
+            return compile_binary_op(e1, e2, int, mul, ex.checked)
+
+        case And(e1, e2):
+            return compile_binary_op(e1, e2, bool, and_, ex.checked)
+
+        case Or(e1, e2):
+            return compile_binary_op(e1, e2, bool, or_, ex.checked)
+
+        case Minus(e):
+            f = compile_exp(e)
+            if ex.checked:
+                return lambda frame, heap: -f(frame, heap)
+            def run(frame, heap):
+                v = f(frame, heap)
+                if type(v) is not int:
+                    raise Exception("Wrong Types in Unary Operation")
+                return -v
+            return run
+
+        case Not(e):
+            f = compile_exp(e)
+            if ex.checked:
+                return lambda frame, heap: not f(frame, heap)
+            def run(frame, heap):
+                v = f(frame, heap)
+                if type(v) is not bool:
+                    raise Exception("Wrong Types in Unary Operation")
+                return not v
+            return run
+
+        case Equal(e1, e2):
+            f1 = compile_exp(e1)
+            f2 = compile_exp(e2)
+            def run(frame, heap):
+                v1 = f1(frame, heap)
+                v2 = f2(frame, heap)
+                return type(v1) is type(v2) and v1 == v2
+            return run
+
+        case If(c, e1, e2):
+            fc = compile_exp(c)
+            f1 = compile_exp(e1)
+            f2 = compile_exp(e2)
+            if ex.checked:
+                def run(frame, heap):
+                    if fc(frame, heap):
+                        return f1(frame, heap)
+                    return f2(frame, heap)
+                return run
+            def run(frame, heap):
+                vc = fc(frame, heap)
+                if type(vc) is not bool:
+                    raise Exception("Non Boolean Condition in Conditional")
+                if vc:
+                    return f1(frame, heap)
+                return f2(frame, heap)
+            return run
+
+        case Deref(i):
+            load_pointer = compile_load_pointer(ex.addr)
+            def run(frame, heap):
+                return heap.apply_native(load_pointer(frame))
+            return run
+
+        case Val(i):
+            load_variable = compile_load_variable(ex.addr)
+            def run(frame, heap):
+                v = load_variable(frame)
+                if type(v) is Pointer:
+                    raise Exception("Variable contains a pointer, pointers are not expressible")
+                return v
+            return run
+
+        case _:
+            return fail("Unknown Expression")
+
+def compile_binary_op(e1: Exp, e2: Exp, typ: type, op, checked: bool | None = None) -> CompiledExp:
+    """
+    Compiles a binary operator whose operands must both be of type "typ" (int for Plus
+    and Mult, bool for And and Or). The types are not checked again when the type
+    checker has already "checked" them.
+    """
+    f1 = compile_exp(e1)
+    f2 = compile_exp(e2)
+    if checked:
+        return lambda frame, heap: op(f1(frame, heap), f2(frame, heap))
+    def run(frame, heap):
+        v1 = f1(frame, heap)
+        v2 = f2(frame, heap)
+        if type(v1) is not typ or type(v2) is not typ:
+            raise Exception("Wrong Types in Binary Operation")
+        return op(v1, v2)
+    return run
+
+# --------------------------------------------
+# COMPILATION OF COMMANDS
+# --------------------------------------------
+
+def compile_com(c: Com, cache: CallCache | None, out: Output, tail: bool = False) -> CompiledCom:
+    """
+    Compiles a resolved command into a closure executing it, showing values on "out".
+    Calls to pure procedures are memoized in "cache" when one is given. A command in
+    "tail" position of a procedure body returns the tail call it reaches (see compile_call).
+    """
+    match c:
+        case Assign(i, Val(x) as source):
+            # Assigning another variable copies its storable value (pointers included)
+            find = compile_lookup(c.addr)
+            load = compile_load(source.addr)
+            def run(frame, heap):
+                (f, slot) = find(frame)
+                if type(f[slot]) is CProc:
+                    raise Exception("Identifier is not bound to a variable")
+                v = load(frame)
+                if type(v) is CProc:
+                    raise Exception("Variable does not contain a pointer")
+                f[slot] = v
+            return run
+
+        case Assign(i, exp):
+            find = compile_lookup(c.addr)
+            fe = compile_exp(exp)
+            def run(frame, heap):
+                (f, slot) = find(frame)
+                if type(f[slot]) is CProc:
+                    raise Exception("Identifier is not bound to a variable")
+                f[slot] = fe(frame, heap)
+            return run
+
+        case While(e, b):
+            fc = compile_exp(e)
+            fb = compile_com(b, cache, out)
+            def run(frame, heap):
+                while fc(frame, heap) is True:
+                    fb(frame, heap)
+            return run
+
+        case CIf(e, b1, b2):
+            fc = compile_exp(e)
+            f1 = compile_com(b1, cache, out, tail)
+            f2 = compile_com(b2, cache, out, tail)
+            def run(frame, heap):
+                if fc(frame, heap) is True:
+                    return f1(frame, heap)
+                return f2(frame, heap)
+            return run
+
+        case Procedure(name, formal_par, body):
+            fb = compile_comlist(body, cache, out, tail=True)
+            slot, param_slots, size = c.slot, c.param_slots, c.size
+            if cache is None:
+                def run(frame, heap):
+                    frame[slot] = CProc(param_slots, size, fb, frame)
+                return run
+
+            pure = is_pure_comlist(body, 0)
+            shadows = c.shadows
+            def run(frame, heap):
+                if shadows or frame[slot] is not None:
+                    # Procedures calling this name may now reach another procedure
+                    cache.clear()
+                frame[slot] = CProc(param_slots, size, fb, frame, pure)
+            return run
+
+        case Call(i, actual_par):
+            if tail:
+                return compile_tail_call(c.addr, actual_par)
+            if cache is not None:
+                return compile_memoized_call(c.addr, actual_par, cache)
+            return compile_call(c.addr, actual_par)
+
+        case NewPointer(i, exp):
+            fe = compile_exp(exp)
+            slot = c.slot
+            if cache is not None:
+                shadows = c.shadows
+                def run(frame, heap):
+                    v = fe(frame, heap)
+                    if shadows or type(frame[slot]) is CProc:
+                        # Calls of this name in pure procedures now reach a pointer
+                        cache.clear()
+                    frame[slot] = Pointer(heap.alloc_native(v))
+                return run
+            def run(frame, heap):
+                frame[slot] = Pointer(heap.alloc_native(fe(frame, heap)))
+            return run
+
+        case DestroyPointer(i):
+            load_pointer = compile_load_pointer(c.addr)
+            def run(frame, heap):
+                heap.free(load_pointer(frame))
+            return run
+
+        case UpdatePointerVal(i, exp):
+            load_pointer = compile_load_pointer(c.addr)
+            fe = compile_exp(exp)
+            def run(frame, heap):
+                heap_location = load_pointer(frame)
+                heap.update_native(heap_location, fe(frame, heap))
+            return run
+
+        case Block(dl, cl):
+            return compile_block(c.size, dl, cl, cache, out, tail)
+
+        case Show(exp):
+            fe = compile_exp(exp)
+            write = out.write
+            def run(frame, heap):
+                write(fe(frame, heap))
+            return run
+
+        case _:
+            return fail("Unknown command")
+
+def compile_arguments(actual_par: list[Exp]) -> list[CompiledExp]:
+    """
+    Compiles the actual parameters of a call. Parameters that are variables are passed
+    as their storable value (so pointers can be passed), the rest are evaluated.
+    """
+    arguments = []
+    for exp in actual_par:
+        match exp:
+            case Val(x):
+                def arg(frame, heap, load=compile_load(exp.addr)):
+                    v = load(frame)
+                    if type(v) is CProc:
+                        raise Exception("Variable was not properly declared or accessible")
+                    return v
+            case _:
+                arg = compile_exp(exp)
+        arguments.append(arg)
+    return arguments
+
+def compile_call(addr: Address, actual_par: list[Exp]) -> CompiledCom:
+    """
+    Compiles a procedure call. The body of the procedure returns the call it makes in
+    tail position, if any, which is then run in a loop instead of being nested in the
+    running call: tail recursion runs at constant Python stack depth.
+    """
+    load = compile_load(addr)
+    arguments = compile_arguments(actual_par)
+
+    def run(frame, heap):
+        cproc = load(frame)
+        if type(cproc) is not CProc:
+            raise Exception("Attempting to call a non-callable value")
+        if len(cproc.param_slots) != len(arguments):
+            raise Exception("Wrong number of parameters")
+        new_frame = [None] * (cproc.size + 1)
+        new_frame[0] = cproc.frame
+        for (slot, arg) in zip(cproc.param_slots, arguments):
+            new_frame[slot] = arg(frame, heap)
+        tail = cproc.body(new_frame, heap)
+        while tail is not None:
+            (cproc, values) = tail
+            new_frame = [None] * (cproc.size + 1)
+            new_frame[0] = cproc.frame
+            for (slot, v) in zip(cproc.param_slots, values):
+                new_frame[slot] = v
+            tail = cproc.body(new_frame, heap)
+    return run
+
+def compile_tail_call(addr: Address, actual_par: list[Exp]) -> CompiledCom:
+    """
+    Compiles a procedure call in tail position: its actual parameters are evaluated and
+    it is returned, to be run by the call it ends (see compile_call)
+    """
+    load = compile_load(addr)
+    arguments = compile_arguments(actual_par)
+
+    def run(frame, heap):
+        cproc = load(frame)
+        if type(cproc) is not CProc:
+            raise Exception("Attempting to call a non-callable value")
+        if len(cproc.param_slots) != len(arguments):
+            raise Exception("Wrong number of parameters")
+        return (cproc, [arg(frame, heap) for arg in arguments])
+    return run
+
+# --------------------------------------------
+# MEMOIZATION
+# --------------------------------------------
+
+# A procedure is pure when running its body cannot change the heap or the frames
+# around it and cannot show anything: it never uses Show, NewPointer, DestroyPointer,
+# UpdatePointerVal or Deref, and only reads and assigns its own variables (parameters
+# and names declared inside it). Calling a pure procedure twice with the same actual
+# parameters does the same thing both times: nothing, unless it raises an exception.
+# So once such a call has completed it can be skipped the next times.
+#
+# A pure procedure may call any procedure. Whether the called ones are pure is only
+# known at run time: a call to a procedure that is not pure taints the calls running
+# around it, which are then not remembered. Declaring a procedure over a name that is
+# already bound, a pointer over a procedure, or either of them over a name that a
+# reference may find ahead of another binding of it (see "shadows" in Interpreter.py)
+# empties the cache, since calls may now reach another procedure.
+#
+# Memoization is only done by this backend: interpret and the VM run every call.
+
+def is_local(addr: Address, level: int) -> bool:
+    """
+    Returns whether a resolved identifier is bound in the frames of the procedure
+    (the procedure frame is "level" frames out)
+    """
+    return all(a is None or a[0] <= level for a in addr)
+
+def is_pure_exp(ex: Exp, level: int) -> bool:
+    """
+    Returns whether evaluating the expression only reads variables of the procedure
+    """
+    match ex:
+        case Int(_) | Bool(_):
+            return True
+        case Plus(e1, e2) | Mult(e1, e2) | And(e1, e2) | Or(e1, e2) | Equal(e1, e2):
+            return is_pure_exp(e1, level) and is_pure_exp(e2, level)
+        case Minus(e) | Not(e):
+            return is_pure_exp(e, level)
+        case If(c, e1, e2):
+            return is_pure_exp(c, level) and is_pure_exp(e1, level) and is_pure_exp(e2, level)
+        case Val(_):
+            return is_local(ex.addr, level)
+        case _:
+            return False
+
+def is_pure_com(c: Com, level: int) -> bool:
+    """
+    Returns whether running the command only changes variables of the procedure,
+    apart from the procedures it calls
+    """
+    match c:
+        case Assign(_, exp):
+            return is_local(c.addr, level) and is_pure_exp(exp, level)
+        case While(e, b):
+            return is_pure_exp(e, level) and is_pure_com(b, level)
+        case CIf(e, b1, b2):
+            return is_pure_exp(e, level) and is_pure_com(b1, level) and is_pure_com(b2, level)
+        case Procedure(_, _, _):
+            return True
+        case Call(_, actual_par):
+            return all(is_pure_exp(e, level) for e in actual_par)
+        case Block(dl, cl):
+            return (all(type(d) is Decl and is_pure_exp(d.e, level + 1) for d in dl)
+                    and is_pure_comlist(cl, level + 1))
+        case _:
+            return False
+
+def is_pure_comlist(cl: list[Com], level: int) -> bool:
+    return all(is_pure_com(c, level) for c in cl)
+
+def compile_memoized_call(addr: Address, actual_par: list[Exp], cache: CallCache) -> CompiledCom:
+    """
+    Compiles a procedure call skipping the calls to pure procedures found in "cache".
+    Tail calls are run in a loop as in compile_call: the calls of the chain complete
+    together, so they are remembered together, unless one of them was tainted.
+    """
+    load = compile_load(addr)
+    arguments = compile_arguments(actual_par)
+
+    def run(frame, heap):
+        cproc = load(frame)
+        if type(cproc) is not CProc:
+            raise Exception("Attempting to call a non-callable value")
+        if len(cproc.param_slots) != len(arguments):
+            raise Exception("Wrong number of parameters")
+        values = [arg(frame, heap) for arg in arguments]
+        tainted = cache.tainted
+        cache.tainted = False
+        keys = []
+        while True:
+            if not cproc.pure:
+                cache.tainted = True
+            else:
+                # Values are keyed with their type, since True == 1 in Python
+                key = (cproc, tuple((type(v), v) for v in values))
+                if key in cache:
+                    break
+                keys.append(key)
+            new_frame = [None] * (cproc.size + 1)
+            new_frame[0] = cproc.frame
+            for (slot, v) in zip(cproc.param_slots, values):
+                new_frame[slot] = v
+            tail = cproc.body(new_frame, heap)
+            if tail is None:
+                break
+            (cproc, values) = tail
+        if not cache.tainted:
+            for key in keys:
+                cache.add(key)
+        cache.tainted = cache.tainted or tainted
+    return run
+
+def compile_block(size: int, dl: list[Decl], cl: list[Com], cache: CallCache | None, out: Output,
+                  tail: bool = False) -> CompiledCom:
+    """
+    Compiles a block: its declarations are evaluated in a new frame, then its commands are run
+    """
+    declarations = []
+    for d in dl:
+        match d:
+            case Decl(i, e):
+                declarations.append((d.slot, compile_exp(e)))
+            case _:
+                declarations.append((0, fail("Invalid Declaration")))
+    fb = compile_comlist(cl, cache, out, tail)
+
+    def run(frame, heap):
+        new_frame = [None] * (size + 1)
+        new_frame[0] = frame
+        for (slot, f) in declarations:
+            new_frame[slot] = f(new_frame, heap)
+        return fb(new_frame, heap)
+    return run
+
+def compile_comlist(cl: list[Com], cache: CallCache | None, out: Output, tail: bool = False) -> CompiledCom:
+    """
+    Compiles a list of commands into a single closure running them in order. The last
+    one is in "tail" position if the list is.
+    """
+    if not cl:
+        return lambda frame, heap: None
+    compiled = tuple(compile_com(c, cache, out) for c in cl[:-1])
+    last = compile_com(cl[-1], cache, out, tail)
+    if not compiled:
+        return last
+
+    def run(frame, heap):
+        for f in compiled:
+            f(frame, heap)
+        return last(frame, heap)
+    return run
+
+def compile_program(c: Com, cache: CallCache | None = None, resolved: bool = False,
+                    out: Output | None = None) -> CompiledCom:
+    """
+    Resolves (unless it is "resolved" already) and compiles the command "c", showing
+    values on "out" (by default written to the standard output as soon as they are
+    shown). The result runs on an empty top-level frame.
+    """
+    if out is None:
+        out = BufferedOutput(size=1)
+    return compile_com(c if resolved else resolve(c), cache, out)
+
+def interpret_compiled(c: Com, heap: Heap | None = None, cache: CallCache | None = None, resolved: bool = False,
+                       out: Output | None = None):
+    """
+    Compiles the command "c" and runs it, on a new heap unless one is given. Calls to
+    pure procedures are memoized if a cache is given. Shown values are written to "out",
+    by default to the standard output through a buffer.
+    """
+    if out is None:
+        out = BufferedOutput()
+    program = compile_program(c, cache, resolved, out)
+    try:
+        program([None], heap if heap is not None else Heap())
+    finally:
+        out.flush()
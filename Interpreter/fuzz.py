@@ -0,0 +1,482 @@
+"""
+DIFFERENTIAL FUZZING
+
+Generates random programs and runs every one of them with interpret (the reference)
+and with the faster engines: the other backends, with or without the optimizer and
+the type checker, the closure compiler memoizing calls, interpret and the VM on a
+garbage collected heap, and the VM suspended and resumed every few steps. An engine
+agrees with interpret on a program when it shows the same values, fails or not in the
+same way, and leaves the heap with the same cells (garbage collected heaps reuse the
+cells they free, so their cells are not compared). The time an engine takes to
+prepare a program (optimizing, type checking, resolving and compiling it) and the
+time it takes to run it are recorded separately: running is reported as a speed-up
+over interpret, preparing as a mean time per program.
+
+    python fuzz.py                              100 programs from a random seed
+    python fuzz.py --programs 1000 --seed 42 --save failures/
+
+Generated programs are meant to run without errors: every name is declared before
+it is used, with the right type, a pointer is never used once it is destroyed,
+loops run a bounded number of times and procedures only call the ones declared
+before them, so every program terminates. A program is rebuilt from its seed alone:
+"generate(seed)" gives it back, and --save writes the disagreeing ones as source
+files (see parser.py) that main.py runs.
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from Interpreter import (
+    Int, Plus, Mult, Minus, Bool, And, Or, Not, Equal, If, Deref, Val,
+    Assign, While, CIf, Procedure, Call, NewPointer, DestroyPointer, UpdatePointerVal, Block, Show,
+    Decl, Exp, Com, Heap, Hval, ListOutput,
+)
+from Interpreter import interpret
+from compiler import CallCache, compile_program
+from optimizer import optimize
+from parser import unparse
+from typechecker import check
+from vm import Machine, compile_vm
+
+# --------------------------------------------
+# GENERATOR
+# --------------------------------------------
+
+INT = "int"
+BOOL = "bool"
+
+@dataclass(eq=False)
+class Name:
+    """
+    What the generator knows of a bound name. The kind is "int" or "bool" for
+    variables, "int pointer" or "bool pointer" for pointers and "procedure" for
+    procedures (with the kinds of their parameters).
+    """
+    kind: str
+    params: tuple[str, ...] = ()
+    cost: int = 0               # procedures: commands run by a call, roughly
+    assignable: bool = True     # variables: False for loop counters
+    destroyable: bool = True    # pointers: False once a procedure may use them
+    destroyed: bool = False
+
+# A scope maps the names bound in a frame, innermost scope last
+Scope = dict[str, Name]
+
+class Generator:
+    """
+    The Generator class builds random programs that terminate and run without
+    errors. Commands binding names in their frame (NewPointer and Procedure) are only
+    generated in lists of commands, never as the body of a While or a branch of a
+    CIf, whose bindings could not be relied on afterwards.
+    """
+
+    def __init__(self, seed: int, depth: int = 4, width: int = 4, iterations: int = 3, max_cost: int = 2_000):
+        self.rng = random.Random(seed)
+        self.depth = depth
+        self.width = width
+        self.iterations = iterations
+        self.max_cost = max_cost
+        self.names = 0
+        # Product of the iteration counts of the enclosing loops, and commands run so
+        # far by the enclosing procedure body (or the program)
+        self.multiplier = 1
+        self.cost = 0
+        # Number of scopes outside the procedure body being built
+        self.procedure_depth = 0
+
+    def fresh(self) -> str:
+        self.names += 1
+        return f"v{self.names}"
+
+    def visible(self, scopes: list[Scope], kind: str, live: bool = True) -> list[tuple[str, Name]]:
+        """
+        Returns the names of the given kind that can be used in the innermost scope
+        """
+        found: dict[str, Name] = {}
+        for scope in scopes:
+            found.update(scope)
+        return [(i, n) for (i, n) in found.items() if n.kind == kind and not (live and n.destroyed)]
+
+    def pick(self, items: list):
+        return items[self.rng.randrange(len(items))]
+
+    # EXPRESSIONS
+
+    def exp(self, kind: str, scopes: list[Scope], depth: int = 2) -> Exp:
+        """
+        Returns an expression of type "kind" ("int" or "bool")
+        """
+        rng = self.rng
+        variables = self.visible(scopes, kind)
+        pointers = self.visible(scopes, f"{kind} pointer")
+        choice = rng.randrange(10) if depth > 0 else rng.randrange(4)
+        if choice in (1, 2) and variables:
+            return Val(self.pick(variables)[0])
+        if choice == 3 and pointers:
+            (i, n) = self.pick(pointers)
+            n.destroyable = n.destroyable and not self.in_procedure(i, scopes)
+            return Deref(i)
+        if choice < 4:
+            return Int(rng.randint(-10, 10)) if kind == INT else Bool(rng.random() < 0.5)
+        if choice == 9:
+            return If(self.exp(BOOL, scopes, depth - 1), self.exp(kind, scopes, depth - 1),
+                      self.exp(kind, scopes, depth - 1))
+        if kind == INT:
+            match choice:
+                case 4 | 5 | 6:
+                    return Plus(self.exp(INT, scopes, depth - 1), self.exp(INT, scopes, depth - 1))
+                case 7:
+                    # Small factors keep the values within the 64 bits of a heap cell
+                    return Mult(self.exp(INT, scopes, depth - 1), Int(rng.randint(-2, 2)))
+                case _:
+                    return Minus(self.exp(INT, scopes, depth - 1))
+        match choice:
+            case 4 | 5:
+                operand = self.pick([INT, BOOL])
+                return Equal(self.exp(operand, scopes, depth - 1), self.exp(operand, scopes, depth - 1))
+            case 6:
+                return And(self.exp(BOOL, scopes, depth - 1), self.exp(BOOL, scopes, depth - 1))
+            case 7:
+                return Or(self.exp(BOOL, scopes, depth - 1), self.exp(BOOL, scopes, depth - 1))
+            case _:
+                return Not(self.exp(BOOL, scopes, depth - 1))
+
+    def in_procedure(self, i: str, scopes: list[Scope]) -> bool:
+        """
+        Returns whether the pointer "i" is used from a procedure body it is not bound
+        in, in which case it must outlive the procedure
+        """
+        return any(i in scope for scope in scopes[:self.procedure_depth])
+
+    # COMMANDS
+
+    def command(self, scopes: list[Scope], depth: int, binding: bool) -> Com:
+        """
+        Returns a command. It may bind a name in the innermost scope only if "binding" is set.
+        """
+        rng = self.rng
+        self.cost += self.multiplier
+        current = scopes[-1]
+        while True:
+            # Commands without subcommands come first
+            choice = rng.randrange(14) if depth > 0 else rng.randrange(9)
+            match choice:
+                case 0 | 1:
+                    targets = [(i, n) for (i, n) in self.visible(scopes, self.pick([INT, BOOL])) if n.assignable]
+                    if targets:
+                        (i, n) = self.pick(targets)
+                        return Assign(i, self.exp(n.kind, scopes))
+                case 2 | 3:
+                    return Show(self.exp(self.pick([INT, BOOL]), scopes))
+                case 4:
+                    kind = self.pick([INT, BOOL])
+                    pointers = self.visible(scopes, f"{kind} pointer")
+                    if pointers:
+                        (i, n) = self.pick(pointers)
+                        n.destroyable = n.destroyable and not self.in_procedure(i, scopes)
+                        return UpdatePointerVal(i, self.exp(kind, scopes))
+                case 5:
+                    if binding:
+                        kind = self.pick([INT, BOOL])
+                        c = NewPointer(self.fresh(), self.exp(kind, scopes))
+                        current[c.i] = Name(f"{kind} pointer")
+                        return c
+                case 6:
+                    # Only pointers of the current frame, which no procedure may use later
+                    owned = [(i, n) for (i, n) in current.items()
+                             if n.kind.endswith("pointer") and n.destroyable and not n.destroyed]
+                    if binding and owned:
+                        (i, n) = self.pick(owned)
+                        n.destroyed = True
+                        return DestroyPointer(i)
+                case 7 | 8:
+                    call = self.call(scopes)
+                    if call is not None:
+                        return call
+                case 9:
+                    return CIf(self.exp(BOOL, scopes), self.command(scopes, depth - 1, False),
+                               self.command(scopes, depth - 1, False))
+                case 10:
+                    return self.loop(scopes, depth)
+                case 11:
+                    return self.block(scopes, depth - 1)
+                case 12 | 13:
+                    if binding:
+                        return self.procedure(scopes, depth)
+
+    def commands(self, scopes: list[Scope], depth: int, width: int) -> list[Com]:
+        return [self.command(scopes, depth, True) for _ in range(self.rng.randint(1, width))]
+
+    def block(self, scopes: list[Scope], depth: int, after: list[Com] = (), width: int | None = None) -> Block:
+        """
+        Returns a block declaring new variables (possibly hiding outer ones) and running
+        up to "width" commands, followed by the commands "after"
+        """
+        scope: Scope = {}
+        declarations = []
+        outer = [i for s in scopes for (i, n) in s.items() if n.kind in (INT, BOOL) and n.assignable]
+        for _ in range(self.rng.randint(0, 3)):
+            kind = self.pick([INT, BOOL])
+            e = self.exp(kind, scopes + [scope])
+            i = self.pick(outer) if outer and self.rng.random() < 0.3 else self.fresh()
+            if i not in scope:
+                declarations.append(Decl(i, e))
+                scope[i] = Name(kind)
+        return Block(declarations, self.commands(scopes + [scope], depth, width or self.width) + list(after))
+
+    def loop(self, scopes: list[Scope], depth: int) -> Block:
+        """
+        Returns a While running a bounded number of times, in a block declaring its counter
+        """
+        counter = self.fresh()
+        n = self.rng.randint(0, self.iterations)
+        scope = {counter: Name(INT, assignable=False)}
+        self.multiplier *= max(n, 1)
+        body = self.block(scopes + [scope], depth - 1, [Assign(counter, Plus(Val(counter), Int(1)))])
+        self.multiplier //= max(n, 1)
+        return Block([Decl(counter, Int(0))], [While(Not(Equal(Val(counter), Int(n))), body)])
+
+    def procedure(self, scopes: list[Scope], depth: int) -> Procedure:
+        """
+        Returns a procedure declaration. The procedure is bound once its body is built,
+        so it never calls itself.
+        """
+        params = tuple(self.pick([INT, BOOL, "int pointer"]) for _ in range(self.rng.randint(0, 3)))
+        formal = [self.fresh() for _ in params]
+        scope = {i: Name(kind, destroyable=False) for (i, kind) in zip(formal, params)}
+        (multiplier, cost, procedure_depth) = (self.multiplier, self.cost, self.procedure_depth)
+        (self.multiplier, self.cost, self.procedure_depth) = (1, 0, len(scopes))
+        body = self.commands(scopes + [scope], depth - 1, self.width)
+        name = Name("procedure", params, cost=self.cost)
+        (self.multiplier, self.cost, self.procedure_depth) = (multiplier, cost, procedure_depth)
+        c = Procedure(self.fresh(), formal, body)
+        scopes[-1][c.name] = name
+        return c
+
+    def call(self, scopes: list[Scope]) -> Call | None:
+        """
+        Returns a call of a visible procedure, or None if none can be called here
+        """
+        procedures = [(i, n) for (i, n) in self.visible(scopes, "procedure")
+                      if n.cost * self.multiplier <= self.max_cost]
+        if not procedures:
+            return None
+        (i, n) = self.pick(procedures)
+        arguments = []
+        for kind in n.params:
+            if kind.endswith("pointer"):
+                pointers = self.visible(scopes, kind)
+                if not pointers:
+                    return None
+                arguments.append(Val(self.pick(pointers)[0]))
+            else:
+                arguments.append(self.exp(kind, scopes))
+        self.cost += n.cost * self.multiplier
+        return Call(i, arguments)
+
+    def program(self) -> Com:
+        return self.block([], self.depth, width=3 * self.width)
+
+def generate(seed: int, depth: int = 4, width: int = 4) -> Com:
+    """
+    Returns the random program of the given seed
+    """
+    return Generator(seed, depth, width).program()
+
+# --------------------------------------------
+# HARNESS
+# --------------------------------------------
+
+@dataclass
+class Outcome:
+    values: list[int | bool]
+    error: str | None
+    cells: dict[int, Hval]
+    compile_time: float
+    run_time: float
+
+@dataclass
+class Engine:
+    backend: str
+    optimized: bool = False
+    typed: bool = False
+    memoized: bool = False      # closures: calls to pure procedures are memoized
+    gc: bool = False            # tree and vm: the heap is garbage collected
+    steps: int | None = None    # vm: the machine is suspended every "steps" steps
+
+    def __str__(self):
+        return (self.backend + ("+opt" if self.optimized else "") + ("+typed" if self.typed else "")
+                + ("+memo" if self.memoized else "") + ("+gc" if self.gc else "")
+                + (f"+steps{self.steps}" if self.steps is not None else ""))
+
+REFERENCE = Engine("tree")
+
+ENGINES = [Engine(backend, optimized, typed)
+           for backend in ("tree", "closures", "vm") for optimized in (False, True) for typed in (False, True)
+           if (backend, optimized, typed) != ("tree", False, False)]
+ENGINES += [
+    Engine("closures", memoized=True),
+    Engine("closures", optimized=True, memoized=True),
+    Engine("tree", gc=True),
+    Engine("vm", gc=True),
+    Engine("vm", steps=3),
+]
+
+# Cells of a garbage collected heap before it grows, few enough for the generated
+# programs to fill it and collect
+GC_HEAP_SIZE = 4
+
+@dataclass
+class Mismatch:
+    seed: int
+    engine: str
+    difference: str
+
+@dataclass
+class Report:
+    programs: int = 0
+    mismatches: list[Mismatch] = field(default_factory=list)
+    # Per engine: the ratios of the run time of interpret to the run time of the engine,
+    # and the times taken to prepare the programs
+    speedups: dict[str, list[float]] = field(default_factory=dict)
+    compile_times: dict[str, list[float]] = field(default_factory=dict)
+    rejected: dict[str, int] = field(default_factory=dict)
+
+def prepare(c: Com, engine: Engine, heap: Heap, out: ListOutput):
+    """
+    Optimizes, type checks and compiles a program for an engine as backends.run does,
+    and returns a function running it
+    """
+    resolved = False
+    if engine.optimized:
+        (c, _) = optimize(c)
+    if engine.typed:
+        c = check(c)
+        resolved = True
+    match engine.backend:
+        case "tree":
+            return lambda: interpret(c, heap, out)
+        case "closures":
+            program = compile_program(c, CallCache() if engine.memoized else None, resolved, out)
+            return lambda: program([None], heap)
+        case "vm":
+            machine = Machine(compile_vm(c, resolved), heap, out)
+            if engine.steps is None:
+                return machine.run
+            def resumed():
+                while not machine.run(engine.steps):
+                    pass
+            return resumed
+    raise Exception(f"Unknown backend {engine.backend}")
+
+def execute(c: Com, engine: Engine) -> Outcome:
+    """
+    Runs a program with an engine, recording what it shows, how it fails, the final heap
+    and the time taken to prepare and to run it
+    """
+    heap = Heap(GC_HEAP_SIZE, gc=True) if engine.gc else Heap()
+    out = ListOutput()
+    error = None
+    compiled = None
+    start = perf_counter()
+    try:
+        program = prepare(c, engine, heap, out)
+        compiled = perf_counter()
+        program()
+    except RecursionError:
+        error = "Maximum recursion depth exceeded"
+    except Exception as e:
+        error = str(e)
+    end = perf_counter()
+    if compiled is None:
+        compiled = end
+    return Outcome(out.values, error, heap.cells(), compiled - start, end - compiled)
+
+def compare(reference: Outcome, outcome: Outcome, cells: bool = True) -> str | None:
+    """
+    Returns how an outcome differs from the reference, or None. Error messages may
+    differ between engines (see vm.py), only whether there is one is compared. The
+    final heaps are only compared if "cells" is set.
+    """
+    typed = lambda values: [(type(v), v) for v in values]
+    if typed(outcome.values) != typed(reference.values):
+        return f"shows {outcome.values} instead of {reference.values}"
+    if (outcome.error is None) != (reference.error is None):
+        return f"fails with {outcome.error!r} instead of {reference.error!r}"
+    if cells and outcome.cells != reference.cells:
+        return f"leaves the heap {outcome.cells} instead of {reference.cells}"
+    return None
+
+def fuzz(seeds: range, engines: list[Engine] = ENGINES, depth: int = 4, width: int = 4) -> Report:
+    """
+    Runs the program of every seed with interpret and with every engine
+    """
+    report = Report()
+    for seed in seeds:
+        c = generate(seed, depth, width)
+        reference = execute(c, REFERENCE)
+        report.programs += 1
+        for engine in engines:
+            name = str(engine)
+            if engine.typed:
+                try:
+                    check(c)
+                except Exception:
+                    # The type checker is stricter than interpret (see typechecker.py)
+                    report.rejected[name] = report.rejected.get(name, 0) + 1
+                    continue
+            outcome = execute(c, engine)
+            difference = compare(reference, outcome, cells=not engine.gc)
+            if difference is not None:
+                report.mismatches.append(Mismatch(seed, name, difference))
+            report.speedups.setdefault(name, []).append(reference.run_time / max(outcome.run_time, 1e-9))
+            report.compile_times.setdefault(name, []).append(outcome.compile_time)
+    return report
+
+def format_report(report: Report) -> str:
+    """
+    Returns the mismatches, the speed-ups of every engine over interpret once the
+    programs are prepared (geometric mean, minimum and maximum over the programs) and
+    the mean time taken to prepare a program
+    """
+    lines = [f"mismatch: seed {m.seed}, {m.engine} {m.difference}" for m in report.mismatches]
+    lines.append(f"{'engine':<26} {'programs':>8} {'speed-up':>9} {'min':>7} {'max':>7} {'compile (ms)':>13}")
+    for (name, ratios) in report.speedups.items():
+        mean = math.exp(sum(math.log(r) for r in ratios) / len(ratios))
+        compile_times = report.compile_times[name]
+        compile_time = 1000 * sum(compile_times) / len(compile_times)
+        rejected = report.rejected.get(name, 0)
+        lines.append(f"{name:<26} {len(ratios):>8} {mean:>8.2f}x {min(ratios):>6.2f}x {max(ratios):>6.2f}x"
+                     f" {compile_time:>13.3f}"
+                     + (f"  ({rejected} rejected by the type checker)" if rejected else ""))
+    lines.append(f"{report.programs} programs, {len(report.mismatches)} mismatches")
+    return "\n".join(lines)
+
+def main(argv: list[str] | None = None):
+    arguments = argparse.ArgumentParser(description="Compares the backends of the Interpreter on random programs")
+    arguments.add_argument("--programs", type=int, default=100, help="number of programs (default: 100)")
+    arguments.add_argument("--seed", type=int, help="seed of the first program (default: random)")
+    arguments.add_argument("--depth", type=int, default=4, help="nesting depth of the commands (default: 4)")
+    arguments.add_argument("--width", type=int, default=4, help="maximum commands per block (default: 4)")
+    arguments.add_argument("--save", help="directory where the source of the disagreeing programs is written")
+    args = arguments.parse_args(argv)
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    print(f"seeds {seed} to {seed + args.programs - 1}")
+    report = fuzz(range(seed, seed + args.programs), depth=args.depth, width=args.width)
+    print(format_report(report))
+    if args.save and report.mismatches:
+        os.makedirs(args.save, exist_ok=True)
+        for s in sorted({m.seed for m in report.mismatches}):
+            with open(os.path.join(args.save, f"fuzz_{s}.txt"), "w") as f:
+                f.write(unparse(generate(s, args.depth, args.width)) + "\n")
+    if report.mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
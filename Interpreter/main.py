@@ -0,0 +1,46 @@
+"""
+Runs a program written in the syntax of parser.py:
+
+    python main.py program.txt
+    python main.py program.txt --backend vm --optimize
+    python main.py program.txt --cache
+    python main.py program.txt --typecheck
+
+"-" reads the program from the standard input. With --cache, the parsed and resolved
+program is kept next to the source file and reused by the next runs (see cache.py).
+The cache is a pickle, which can run code when it is read: only use --cache in
+directories that only trusted users can write to.
+"""
+
+import argparse
+import sys
+
+from backends import BACKENDS, run
+from cache import load_cached
+from parser import load, parse
+
+def main(argv: list[str] | None = None):
+    arguments = argparse.ArgumentParser(description="Runs a program of the Interpreter language")
+    arguments.add_argument("file", help="the source file, or - for the standard input")
+    arguments.add_argument("--backend", choices=BACKENDS, default="tree", help="how to execute the program (default: tree)")
+    arguments.add_argument("--optimize", action="store_true", help="fold constants and remove dead branches first")
+    arguments.add_argument("--cache", action="store_true", help="reuse the program parsed by a previous run (loads a pickle from the "
+                           "source directory, which can run code: trusted directories only)")
+    arguments.add_argument("--typecheck", action="store_true", help="check the types of the program before running it")
+    args = arguments.parse_args(argv)
+    if args.cache and args.file == "-":
+        arguments.error("--cache needs a source file")
+
+    try:
+        if args.cache:
+            run(load_cached(args.file, args.optimize), args.backend, resolved=True, typed=args.typecheck)
+        else:
+            c = parse(sys.stdin) if args.file == "-" else load(args.file)
+            run(c, args.backend, args.optimize, typed=args.typecheck)
+    except OSError as e:
+        sys.exit(f"Cannot read {args.file}: {e.strerror}")
+    except Exception as e:
+        sys.exit(f"Error: {e}")
+
+if __name__ == "__main__":
+    main()
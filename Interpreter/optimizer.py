@@ -0,0 +1,220 @@
+"""
+OPTIMIZER
+
+An optional stage run on a program before it is executed (and before resolver.py):
+
+- constant folding: Plus, Mult, Minus, And, Or, Not and Equal whose operands are
+  constants are replaced by their value.
+- dead-branch elimination: If and CIf with a constant condition are replaced by the
+  branch that would run, and a While whose condition is a constant other than
+  Bool(True) is dropped.
+
+Only operations that cannot fail are folded: Plus(Int(1), Bool(True)) is left as it
+is, so it still raises "Wrong Types in Binary Operation" when it is executed, and so
+is If(Int(1), ...). The optimized program behaves exactly like the original one.
+"""
+
+from dataclasses import dataclass
+
+from Interpreter import (
+    Int, Plus, Mult, Minus, Bool, And, Or, Not, Equal, If, Deref, Val,
+    Assign, While, CIf, Procedure, Call, NewPointer, DestroyPointer, UpdatePointerVal, Block, Show,
+    Decl, Exp, Com,
+)
+
+@dataclass
+class OptimizationReport:
+    nodes_before: int
+    nodes_after: int
+    folded: int = 0
+    branches_removed: int = 0
+    loops_removed: int = 0
+
+    def eliminated(self) -> int:
+        """
+        Returns the number of nodes removed from the program
+        """
+        return self.nodes_before - self.nodes_after
+
+    def __str__(self):
+        return (f"{self.eliminated()} of {self.nodes_before} nodes eliminated "
+                f"({self.folded} folded, {self.branches_removed} branches and "
+                f"{self.loops_removed} loops removed)")
+
+# --------------------------------------------
+# HELPER FUNCTIONS
+# --------------------------------------------
+
+def count_nodes(node) -> int:
+    """
+    Returns the number of syntax nodes (expressions, commands and declarations) of a tree
+    """
+    match node:
+        case Int(_) | Bool(_) | Deref(_) | Val(_) | DestroyPointer(_):
+            return 1
+        case Plus(e1, e2) | Mult(e1, e2) | And(e1, e2) | Or(e1, e2) | Equal(e1, e2):
+            return 1 + count_nodes(e1) + count_nodes(e2)
+        case Minus(e) | Not(e) | Show(e) | Assign(_, e) | NewPointer(_, e) | UpdatePointerVal(_, e) | Decl(_, e):
+            return 1 + count_nodes(e)
+        case If(c, e1, e2) | CIf(c, e1, e2):
+            return 1 + count_nodes(c) + count_nodes(e1) + count_nodes(e2)
+        case While(e, b):
+            return 1 + count_nodes(e) + count_nodes(b)
+        case Procedure(_, _, body):
+            return 1 + sum(count_nodes(b) for b in body)
+        case Call(_, actual_par):
+            return 1 + sum(count_nodes(e) for e in actual_par)
+        case Block(dl, cl):
+            return 1 + sum(count_nodes(d) for d in dl) + sum(count_nodes(b) for b in cl)
+        case _:
+            return 1
+
+def is_constant(ex: Exp) -> bool:
+    """
+    Returns whether the expression is an integer or boolean literal
+    """
+    return type(ex) is Int or type(ex) is Bool
+
+# --------------------------------------------
+# OPTIMIZATION OF EXPRESSIONS
+# --------------------------------------------
+
+def optimize_exp(ex: Exp, report: OptimizationReport) -> Exp:
+    """
+    Returns the expression with its constant subexpressions folded
+    """
+    match ex:
+        case Plus(e1, e2) | Mult(e1, e2):
+            e1 = optimize_exp(e1, report)
+            e2 = optimize_exp(e2, report)
+            if type(e1) is Int and type(e2) is Int:
+                report.folded += 1
+                return Int(e1.value + e2.value if type(ex) is Plus else e1.value * e2.value)
+            return type(ex)(e1, e2)
+
+        case And(e1, e2) | Or(e1, e2):
+            e1 = optimize_exp(e1, report)
+            e2 = optimize_exp(e2, report)
+            if type(e1) is Bool and type(e2) is Bool:
+                report.folded += 1
+                return Bool(e1.value and e2.value if type(ex) is And else e1.value or e2.value)
+            return type(ex)(e1, e2)
+
+        case Minus(e):
+            e = optimize_exp(e, report)
+            if type(e) is Int:
+                report.folded += 1
+                return Int(-e.value)
+            return Minus(e)
+
+        case Not(e):
+            e = optimize_exp(e, report)
+            if type(e) is Bool:
+                report.folded += 1
+                return Bool(not e.value)
+            return Not(e)
+
+        case Equal(e1, e2):
+            e1 = optimize_exp(e1, report)
+            e2 = optimize_exp(e2, report)
+            if is_constant(e1) and is_constant(e2):
+                # An integer is never equal to a boolean, as with EInt and EBool
+                report.folded += 1
+                return Bool(type(e1) is type(e2) and e1.value == e2.value)
+            return Equal(e1, e2)
+
+        case If(c, e1, e2):
+            c = optimize_exp(c, report)
+            if type(c) is Bool:
+                report.branches_removed += 1
+                return optimize_exp(e1 if c.value == True else e2, report)
+            return If(c, optimize_exp(e1, report), optimize_exp(e2, report))
+
+        case _:
+            return ex
+
+# --------------------------------------------
+# OPTIMIZATION OF COMMANDS
+# --------------------------------------------
+
+def optimize_com(c: Com, report: OptimizationReport) -> Com | None:
+    """
+    Returns the optimized command, or None if the command does nothing
+    """
+    match c:
+        case Assign(i, exp):
+            return Assign(i, optimize_exp(exp, report))
+
+        case While(e, b):
+            e = optimize_exp(e, report)
+            if is_constant(e) and e != Bool(True):
+                # The body never runs: only conditions equal to Bool(True) enter the loop
+                report.loops_removed += 1
+                return None
+            return While(e, optimize_single(b, report))
+
+        case CIf(e, b1, b2):
+            e = optimize_exp(e, report)
+            if is_constant(e):
+                report.branches_removed += 1
+                return optimize_com(b1 if e == Bool(True) else b2, report)
+            return CIf(e, optimize_single(b1, report), optimize_single(b2, report))
+
+        case Procedure(name, formal_par, body):
+            return Procedure(name, formal_par, optimize_comlist(body, report))
+
+        case Call(i, actual_par):
+            return Call(i, [optimize_exp(e, report) for e in actual_par])
+
+        case NewPointer(i, exp):
+            return NewPointer(i, optimize_exp(exp, report))
+
+        case UpdatePointerVal(i, exp):
+            return UpdatePointerVal(i, optimize_exp(exp, report))
+
+        case Block(dl, cl):
+            declarations = []
+            for d in dl:
+                match d:
+                    case Decl(i, e):
+                        declarations.append(Decl(i, optimize_exp(e, report)))
+                    case _:
+                        declarations.append(d)
+            return Block(declarations, optimize_comlist(cl, report))
+
+        case Show(exp):
+            return Show(optimize_exp(exp, report))
+
+        case _:
+            return c
+
+def optimize_single(c: Com, report: OptimizationReport) -> Com:
+    """
+    Optimizes a command that cannot be removed (the body of a While, a branch of a CIf).
+    A command doing nothing is replaced by an empty block.
+    """
+    optimized = optimize_com(c, report)
+    if optimized is None:
+        return Block([], [])
+    return optimized
+
+def optimize_comlist(cl: list[Com], report: OptimizationReport) -> list[Com]:
+    """
+    Optimizes a list of commands, leaving out the ones doing nothing
+    """
+    optimized = []
+    for c in cl:
+        c = optimize_com(c, report)
+        if c is not None:
+            optimized.append(c)
+    return optimized
+
+def optimize(c: Com) -> tuple[Com, OptimizationReport]:
+    """
+    Optimizes a whole program. Returns the new program and a report of what was
+    eliminated, the original tree is left as it is.
+    """
+    report = OptimizationReport(count_nodes(c), 0)
+    optimized = optimize_single(c, report)
+    report.nodes_after = count_nodes(optimized)
+    return (optimized, report)
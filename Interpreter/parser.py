@@ -0,0 +1,262 @@
+"""
+PARSER
+
+Reads programs written as text. The concrete syntax is the one of the ABSTRACT
+SYNTAX in Interpreter.py, so a program reads exactly like the Python expression
+that would build it:
+
+    Block(
+        [Decl("x", Int(5))],
+        [
+            While(Not(Equal(Val("x"), Int(0))), Assign("x", Plus(Val("x"), Int(-1)))),
+            Show(Val("x"))   # comments run until the end of the line
+        ]
+    )
+
+Identifiers can be written with or without quotes (Val(x) is Val("x")), integers may
+be negative and booleans are True and False. A program is a single command.
+
+The parser is hand-written (recursive descent with one token of lookahead) and the
+lexer only uses a regular expression that does not backtrack. The source is read line
+by line and every character is looked at once, so loading a program takes time
+linear in its size and never holds more than one line of source besides the tree
+being built. Unlike eval, it does not compile the source to Python bytecode first.
+"""
+
+import re
+from dataclasses import fields
+from typing import Iterable, Iterator
+
+from Interpreter import (
+    Int, Plus, Mult, Minus, Bool, And, Or, Not, Equal, If, Deref, Val,
+    Assign, While, CIf, Procedure, Call, NewPointer, DestroyPointer, UpdatePointerVal, Block, Show,
+    Decl, Com,
+)
+
+# The arguments of every constructor, by kind: "exp", "com", "ide", "num", "bool" or a
+# list of one of them ("exps", "coms", "ides", "decls")
+EXPRESSIONS = {
+    "Int": (Int, ("num",)),
+    "Plus": (Plus, ("exp", "exp")),
+    "Mult": (Mult, ("exp", "exp")),
+    "Minus": (Minus, ("exp",)),
+    "Bool": (Bool, ("bool",)),
+    "And": (And, ("exp", "exp")),
+    "Or": (Or, ("exp", "exp")),
+    "Not": (Not, ("exp",)),
+    "Equal": (Equal, ("exp", "exp")),
+    "If": (If, ("exp", "exp", "exp")),
+    "Deref": (Deref, ("ide",)),
+    "Val": (Val, ("ide",)),
+}
+
+COMMANDS = {
+    "Assign": (Assign, ("ide", "exp")),
+    "While": (While, ("exp", "com")),
+    "CIf": (CIf, ("exp", "com", "com")),
+    "Procedure": (Procedure, ("ide", "ides", "coms")),
+    "Call": (Call, ("ide", "exps")),
+    "NewPointer": (NewPointer, ("ide", "exp")),
+    "DestroyPointer": (DestroyPointer, ("ide",)),
+    "UpdatePointerVal": (UpdatePointerVal, ("ide", "exp")),
+    "Block": (Block, ("decls", "coms")),
+    "Show": (Show, ("exp",)),
+}
+
+DECLARATIONS = {
+    "Decl": (Decl, ("ide", "exp")),
+}
+
+# --------------------------------------------
+# LEXER
+# --------------------------------------------
+
+# Tokens are identifiers, integers, quoted identifiers, punctuation and comments, any
+# other character being a token of its own (an error for the parser). Every
+# alternative starts with characters no other alternative starts with, and none is
+# followed by anything that could give characters back, so matching never goes back
+# more than one character (a "-" that is not followed by a digit). Blanks match
+# nothing and are skipped.
+TOKEN = re.compile(r"""[A-Za-z_]\w*|-?\d+|"[^"\n]*"|'[^'\n]*'|[()\[\],]|#.*|\S""")
+
+# A whole token that is an integer
+INTEGER = re.compile(r"-?\d+")
+
+END = ""
+
+# --------------------------------------------
+# PARSER
+# --------------------------------------------
+
+class Parser:
+    """
+    The Parser class builds the syntax tree of a program with one token of lookahead.
+    Tokens are the strings matched by TOKEN, the end of the source is END.
+    """
+
+    def __init__(self, lines: Iterable[str]):
+        self.line = 0
+        self.tokens = self.tokenize(lines)
+        self.current = next(self.tokens)
+        self.arguments = {
+            "exp": self.exp,
+            "com": self.com,
+            "ide": self.ide,
+            "num": self.num,
+            "bool": self.bool,
+            "exps": lambda: self.listof(self.exp),
+            "coms": lambda: self.listof(self.com),
+            "ides": lambda: self.listof(self.ide),
+            "decls": lambda: self.listof(self.decl),
+        }
+
+    def tokenize(self, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Splits the source, given as lines, into tokens, keeping track of the current line
+        """
+        for line in lines:
+            self.line += 1
+            tokens = TOKEN.findall(line)
+            if tokens and tokens[-1][0] == "#":
+                tokens.pop()
+            yield from tokens
+        self.line += 1
+        yield END
+
+    def error(self, expected: str):
+        found = self.current if self.current != END else "end of file"
+        raise Exception(f"Syntax error at line {self.line}: expected {expected}, found {found}")
+
+    def advance(self) -> str:
+        t = self.current
+        self.current = next(self.tokens)
+        return t
+
+    def expect(self, token: str):
+        if self.current != token:
+            self.error(token)
+        self.current = next(self.tokens)
+
+    def node(self, constructors: dict, expected: str):
+        """
+        Parses a constructor applied to its arguments, the constructor being one of "constructors"
+        """
+        entry = constructors.get(self.current)
+        if entry is None:
+            self.error(expected)
+        (constructor, kinds) = entry
+        self.current = next(self.tokens)
+        self.expect("(")
+        args = [self.arguments[kinds[0]]()]
+        for kind in kinds[1:]:
+            self.expect(",")
+            args.append(self.arguments[kind]())
+        self.expect(")")
+        return constructor(*args)
+
+    def exp(self):
+        return self.node(EXPRESSIONS, "an expression")
+
+    def com(self):
+        return self.node(COMMANDS, "a command")
+
+    def decl(self):
+        return self.node(DECLARATIONS, "a declaration")
+
+    def listof(self, item) -> list:
+        """
+        Parses a list in square brackets, each element being parsed by "item"
+        """
+        self.expect("[")
+        items = []
+        while self.current != "]":
+            items.append(item())
+            if self.current != ",":
+                break
+            self.current = next(self.tokens)
+        self.expect("]")
+        return items
+
+    def ide(self) -> str:
+        t = self.current
+        if t[:1] == '"' or t[:1] == "'":
+            if len(t) < 2:
+                raise Exception(f"Syntax error at line {self.line}: unterminated identifier")
+            self.current = next(self.tokens)
+            return t[1:-1]
+        if not (t[:1].isalpha() or t[:1] == "_"):
+            self.error("an identifier")
+        self.current = next(self.tokens)
+        return t
+
+    def num(self) -> int:
+        t = self.current
+        if not INTEGER.fullmatch(t):
+            self.error("an integer")
+        self.current = next(self.tokens)
+        return int(t)
+
+    def bool(self) -> bool:
+        if self.current != "True" and self.current != "False":
+            self.error("True or False")
+        return self.advance() == "True"
+
+    def program(self) -> Com:
+        c = self.com()
+        if self.current != END:
+            self.error("end of file")
+        return c
+
+def parse(source: str | Iterable[str]) -> Com:
+    """
+    Parses a program, given as a string or as an iterable of lines (like an open file)
+    """
+    if isinstance(source, str):
+        source = source.splitlines()
+    return Parser(source).program()
+
+def load(path: str) -> Com:
+    """
+    Parses the program in the file at "path"
+    """
+    with open(path) as f:
+        return parse(f)
+
+# --------------------------------------------
+# PRINTER
+# --------------------------------------------
+
+def unparse(node) -> str:
+    """
+    Returns the source of a syntax tree, which parse reads back into an equal tree
+    """
+    parts: list[str] = []
+    write(node, parts)
+    return "".join(parts)
+
+def write(node, parts: list[str]):
+    """
+    Appends the source of "node" to "parts"
+    """
+    match node:
+        case list():
+            parts.append("[")
+            for (k, item) in enumerate(node):
+                if k > 0:
+                    parts.append(", ")
+                write(item, parts)
+            parts.append("]")
+        case str():
+            parts.append(f'"{node}"')
+        case bool() | int():
+            parts.append(str(node))
+        case _:
+            parts.append(type(node).__name__)
+            parts.append("(")
+            # Resolver annotations are keyword-only fields, not part of the syntax
+            arguments = [f.name for f in fields(node) if not f.kw_only]
+            for (k, name) in enumerate(arguments):
+                if k > 0:
+                    parts.append(", ")
+                write(getattr(node, name), parts)
+            parts.append(")")
@@ -0,0 +1,171 @@
+"""
+PROFILER
+
+Runs a program with the tree-walking interpreter (interpret) while counting, for every
+kind of node and for every individual node, how many times it was executed and how much
+wall time was spent in it. Heap allocations and frees and the maximum depth of the frame
+stack are recorded as well.
+
+The profile is the hook given to interpret (see Hook in Interpreter.py): every
+expression, command and declaration run goes through it, and nothing else is
+instrumented, so programs can be run and profiled at the same time. Every Decl of a
+Block counts as a node. A Call in
+tail position (see semcall) only counts the evaluation of its actual parameters, its
+body being run by the call it replaces.
+
+    prof = profile(c)
+    print(prof.report())
+    prof.dump("profile.json")
+
+Times are reported both cumulated (including the nodes run inside a node) and as self
+time (excluding them). A node running inside itself, like a recursive Call, is only
+counted once in its cumulated time.
+"""
+
+import json
+from dataclasses import dataclass, asdict
+from time import perf_counter
+
+from Interpreter import (
+    interpret, Int, Bool, Deref, Val, Assign, Procedure, Call, NewPointer, DestroyPointer, UpdatePointerVal,
+    Decl, Com, Heap, Output,
+)
+
+@dataclass
+class NodeStats:
+    label: str
+    count: int = 0
+    cumulated: float = 0.0
+    self_time: float = 0.0
+    active: int = 0
+
+def node_label(node, ordinal: int) -> str:
+    """
+    Returns a short description of a node: the identifier or value it holds when it has
+    one, otherwise its kind and the order in which it was first run among nodes of that kind
+    """
+    kind = type(node).__name__
+    match node:
+        case Int(v) | Bool(v):
+            return f"{kind}({v})"
+        case Val(i) | Deref(i) | Assign(i, _) | NewPointer(i, _) | DestroyPointer(i) | UpdatePointerVal(i, _) | Decl(i, _):
+            return f'{kind}("{i}") #{ordinal}'
+        case Procedure(i, parameters, _) | Call(i, parameters):
+            return f'{kind}("{i}", {len(parameters)} parameters) #{ordinal}'
+        case _:
+            return f"{kind} #{ordinal}"
+
+class Profile:
+    """
+    The Profile class collects the counters of a profiled run, and formats them as a
+    report or as JSON.
+    """
+
+    def __init__(self):
+        self.kinds: dict[str, NodeStats] = {}
+        self.nodes: dict[int, NodeStats] = {}
+        self.keep_alive: list = []
+        self.seen: dict[str, int] = {}
+        self.max_depth = 0
+        self.allocations = 0
+        self.frees = 0
+        self.total_time = 0.0
+        self.children: list[float] = []
+
+    def stats_for(self, node) -> tuple[NodeStats, NodeStats]:
+        """
+        Returns the counters of the kind of "node" and of "node" itself
+        """
+        kind = type(node).__name__
+        if kind not in self.kinds:
+            self.kinds[kind] = NodeStats(kind)
+        node_stats = self.nodes.get(id(node))
+        if node_stats is None:
+            self.seen[kind] = self.seen.get(kind, 0) + 1
+            node_stats = NodeStats(node_label(node, self.seen[kind]))
+            self.nodes[id(node)] = node_stats
+
+            # Keeping the node alive so that its id is not reused by another node
+            self.keep_alive.append(node)
+        return (self.kinds[kind], node_stats)
+
+    def __call__(self, run, node, frame_stack, heap, *out):
+        """
+        Runs a node as the hook of interpret, updating its counters
+        """
+        (kind_stats, node_stats) = self.stats_for(node)
+        if len(frame_stack.s) > self.max_depth:
+            self.max_depth = len(frame_stack.s)
+        kind_stats.active += 1
+        node_stats.active += 1
+        self.children.append(0.0)
+        start = perf_counter()
+        try:
+            return run(node, frame_stack, heap, *out)
+        finally:
+            elapsed = perf_counter() - start
+            own = elapsed - self.children.pop()
+            if self.children:
+                self.children[-1] += elapsed
+            for stats in (kind_stats, node_stats):
+                stats.active -= 1
+                stats.count += 1
+                stats.self_time += own
+                if stats.active == 0:
+                    stats.cumulated += elapsed
+
+    def as_dict(self) -> dict:
+        """
+        Returns the counters as a dictionary, nodes sorted by cumulated time
+        """
+        def rows(stats):
+            ordered = sorted(stats, key=lambda s: s.cumulated, reverse=True)
+            return [{k: v for (k, v) in asdict(s).items() if k != "active"} for s in ordered]
+        return {
+            "total_time": self.total_time,
+            "max_frame_depth": self.max_depth,
+            "heap_allocations": self.allocations,
+            "heap_frees": self.frees,
+            "kinds": rows(self.kinds.values()),
+            "nodes": rows(self.nodes.values()),
+        }
+
+    def dump(self, path: str):
+        """
+        Writes the counters to a JSON file
+        """
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def report(self, top: int = 20) -> str:
+        """
+        Returns a table of the node kinds and of the "top" nodes with the largest cumulated time
+        """
+        data = self.as_dict()
+        lines = [
+            f"total time {data['total_time']:.6f} s, max frame depth {data['max_frame_depth']}, "
+            f"heap allocations {data['heap_allocations']}, heap frees {data['heap_frees']}",
+        ]
+        for (title, table) in (("kind", data["kinds"]), ("node", data["nodes"][:top])):
+            lines.append("")
+            lines.append(f"{title:<40} {'count':>10} {'cumulated (s)':>14} {'self (s)':>10}")
+            for row in table:
+                lines.append(f"{row['label']:<40} {row['count']:>10} {row['cumulated']:>14.6f} {row['self_time']:>10.6f}")
+        return "\n".join(lines)
+
+def profile(c: Com, heap: Heap | None = None, out: Output | None = None) -> Profile:
+    """
+    Interprets the command "c" with the profile as hook and returns the collected profile
+    """
+    prof = Profile()
+    if heap is None:
+        heap = Heap()
+    (allocations, frees) = (heap.allocations, heap.frees)
+    start = perf_counter()
+    try:
+        interpret(c, heap, out, hook=prof)
+    finally:
+        prof.total_time = perf_counter() - start
+        prof.allocations = heap.allocations - allocations
+        prof.frees = heap.frees - frees
+    return prof
@@ -0,0 +1,254 @@
+"""
+RESOLVER
+
+Computes the lexical address of every identifier before the program runs, so that
+a backend can replace FrameStack.search_name (a walk over the static links and a
+reverse scan of every Env) with an indexed load.
+
+Every frame (a Block, or the body of a Procedure) gets one slot per name it binds.
+Slot 0 of a frame is kept for its static link, so the slots of names start at 1.
+References are resolved to the (depth, slot) pairs of the frames that may bind the
+name at that point of the program:
+
+- in the code of a frame itself, bindings are known exactly: a name is bound once the
+  Decl, NewPointer or Procedure binding it has been executed.
+- in the body of a procedure, names of the frame where the procedure is declared that
+  are bound later than the procedure may or may not be bound yet when it is called.
+  These references keep several candidates, and the backend takes the first one that
+  is bound at run time. When no candidate is certain, the address ends with None and
+  the backend reports "Name Not Found" if none of them is bound.
+
+- bindings that only happen on some runs (a NewPointer or Procedure used directly as
+  the body of a While or as a branch of a CIf) may or may not have been executed after
+  the While or CIf, or in a later iteration of the While. References to such names keep
+  the frame as a candidate, followed by the frames around it.
+
+A name that cannot be bound at all is reported at resolve time.
+"""
+
+from Interpreter import (
+    Plus, Mult, Minus, And, Or, Not, Equal, If, Deref, Val,
+    Assign, While, CIf, Procedure, Call, NewPointer, DestroyPointer, UpdatePointerVal, Block, Show,
+    Decl, Exp, Com, Ide, Address,
+)
+
+# --------------------------------------------
+# SCOPES
+# --------------------------------------------
+
+class Scope:
+    """
+    The Scope class is the resolver's picture of a frame: the slot of every name the
+    frame binds, and the names already bound (or maybe bound) at the point being resolved.
+    """
+
+    def __init__(self, names: list[Ide]):
+        """
+        Gives a slot to every name bound in the frame, starting at 1
+        """
+        self.slots: dict[Ide, int] = {}
+        for name in names:
+            if name not in self.slots:
+                self.slots[name] = len(self.slots) + 1
+        self.bound: set[Ide] = set()
+        self.maybe_bound: set[Ide] = set()
+
+        # Names that a reference may find in this frame ahead of another candidate, and
+        # the NewPointer and Procedure nodes binding names in the frame
+        self.shadowing: set[Ide] = set()
+        self.binding_nodes: list[NewPointer | Procedure] = []
+
+    def size(self) -> int:
+        """
+        Returns the number of slots of the frame (without the static link)
+        """
+        return len(self.slots)
+
+    def bind(self, name: Ide) -> int:
+        """
+        Marks "name" as bound from now on and returns its slot
+        """
+        self.bound.add(name)
+        return self.slots[name]
+
+    def finish(self):
+        """
+        Marks the binding nodes of the frame that shadow, once every reference has been resolved
+        """
+        for node in self.binding_nodes:
+            node.shadows = (node.name if type(node) is Procedure else node.i) in self.shadowing
+
+# A view is how a frame is seen from the code being resolved: the scope, the names
+# that are certainly bound and the names that may be bound
+View = tuple[Scope, set[Ide], set[Ide]]
+
+def lookup(i: Ide, views: list[View]) -> Address:
+    """
+    Returns the candidate (depth, slot) pairs for the identifier "i", innermost first
+    """
+    candidates = []
+    scopes = []
+    certain = False
+    for depth, (scope, bound, maybe_bound) in enumerate(views):
+        if i in bound or i in maybe_bound:
+            candidates.append((depth, scope.slots[i]))
+            scopes.append(scope)
+            if i in bound:
+                certain = True
+                break
+    if not candidates:
+        raise Exception(f"Name Not Found: {i}")
+
+    # Binding the name in any frame but the last candidate changes what the reference reaches
+    for scope in scopes[:-1]:
+        scope.shadowing.add(i)
+
+    # None marks that none of the candidates is certainly bound
+    return tuple(candidates) if certain else tuple(candidates) + (None,)
+
+def bind(i: Ide, views: list[View]) -> int:
+    """
+    Binds the identifier "i" in the current frame and returns its slot
+    """
+    if not views:
+        raise Exception(f"Binding {i} outside of a block")
+    return views[0][0].bind(i)
+
+def binders(cl: list[Com]) -> list[Ide]:
+    """
+    Returns the names bound by a list of commands in the frame they run in, including
+    the ones bound by the body of a While or a branch of a CIf
+    """
+    names = []
+    for c in cl:
+        match c:
+            case NewPointer(i, _) | Procedure(i, _, _):
+                names.append(i)
+            case While(_, b):
+                names.extend(binders([b]))
+            case CIf(_, b1, b2):
+                names.extend(binders([b1, b2]))
+    return names
+
+def conditional_binders(c: Com, views: list[View]) -> list[Ide]:
+    """
+    Returns the names that the body of a While or a branch of a CIf binds in the
+    current frame and that are not certainly bound there yet
+    """
+    if not views:
+        return []
+    return [i for i in binders([c]) if i not in views[0][1]]
+
+def resolve_branch(c: Com, views: list[View]) -> Com:
+    """
+    Resolves the body of a While or a branch of a CIf. The names it binds in the
+    current frame are only maybe bound once it has run.
+    """
+    names = conditional_binders(c, views)
+    c = resolve_com(c, views)
+    for i in names:
+        views[0][1].discard(i)
+        views[0][2].add(i)
+    return c
+
+# --------------------------------------------
+# RESOLUTION OF EXPRESSIONS
+# --------------------------------------------
+
+def resolve_exp(ex: Exp, views: list[View]) -> Exp:
+    """
+    Returns a copy of the expression with the addresses of its identifiers filled in
+    """
+    match ex:
+        case Plus(e1, e2) | Mult(e1, e2) | And(e1, e2) | Or(e1, e2) | Equal(e1, e2):
+            return type(ex)(resolve_exp(e1, views), resolve_exp(e2, views))
+        case Minus(e) | Not(e):
+            return type(ex)(resolve_exp(e, views))
+        case If(c, e1, e2):
+            return If(resolve_exp(c, views), resolve_exp(e1, views), resolve_exp(e2, views))
+        case Deref(i) | Val(i):
+            return type(ex)(i, addr=lookup(i, views))
+        case _:
+            return ex
+
+# --------------------------------------------
+# RESOLUTION OF COMMANDS
+# --------------------------------------------
+
+def resolve_com(c: Com, views: list[View]) -> Com:
+    """
+    Returns a copy of the command with the addresses of its identifiers and the slots
+    of its bindings filled in
+    """
+    match c:
+        case Assign(i, exp):
+            addr = lookup(i, views)
+            return Assign(i, resolve_exp(exp, views), addr=addr)
+
+        case While(e, b):
+            # The condition and the body also run after the iterations that bound names
+            for i in conditional_binders(b, views):
+                views[0][2].add(i)
+            return While(resolve_exp(e, views), resolve_branch(b, views))
+
+        case CIf(e, b1, b2):
+            e = resolve_exp(e, views)
+            return CIf(e, resolve_branch(b1, views), resolve_branch(b2, views))
+
+        case Procedure(name, formal_par, body):
+            slot = bind(name, views)
+            scope = Scope(list(formal_par) + binders(body))
+            param_slots = tuple(scope.bind(i) for i in formal_par)
+
+            # The declaring frame can still bind names after the procedure, before it is called
+            (outer, bound, _) = views[0]
+            body_views = [(scope, scope.bound, scope.maybe_bound), (outer, set(bound), set(outer.slots))] + views[1:]
+            body = [resolve_com(b, body_views) for b in body]
+            scope.finish()
+            node = Procedure(name, formal_par, body, slot=slot, param_slots=param_slots, size=scope.size())
+            views[0][0].binding_nodes.append(node)
+            return node
+
+        case Call(i, actual_par):
+            addr = lookup(i, views)
+            return Call(i, [resolve_exp(e, views) for e in actual_par], addr=addr)
+
+        case NewPointer(i, exp):
+            exp = resolve_exp(exp, views)
+            node = NewPointer(i, exp, slot=bind(i, views))
+            views[0][0].binding_nodes.append(node)
+            return node
+
+        case DestroyPointer(i):
+            return DestroyPointer(i, addr=lookup(i, views))
+
+        case UpdatePointerVal(i, exp):
+            addr = lookup(i, views)
+            return UpdatePointerVal(i, resolve_exp(exp, views), addr=addr)
+
+        case Block(dl, cl):
+            scope = Scope([d.i for d in dl if isinstance(d, Decl)] + binders(cl))
+            block_views = [(scope, scope.bound, scope.maybe_bound)] + views
+            declarations = []
+            for d in dl:
+                match d:
+                    case Decl(i, e):
+                        e = resolve_exp(e, block_views)
+                        declarations.append(Decl(i, e, slot=scope.bind(i)))
+                    case _:
+                        declarations.append(d)
+            commands = [resolve_com(b, block_views) for b in cl]
+            scope.finish()
+            return Block(declarations, commands, size=scope.size())
+
+        case Show(exp):
+            return Show(resolve_exp(exp, views))
+
+        case _:
+            return c
+
+def resolve(c: Com) -> Com:
+    """
+    Resolves a whole program. The result is a copy of "c", the original tree is left as it is.
+    """
+    return resolve_com(c, [])
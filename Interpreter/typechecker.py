@@ -0,0 +1,320 @@
+"""
+TYPE CHECKER
+
+Infers, before a program runs, the type of every variable, of every heap cell reached
+through a pointer and of the parameters of every procedure:
+
+Type := int | bool | pointer to Type | procedure(Listof Type)
+
+A variable keeps the same type for its whole life, so every Assign to it must have
+the type of its declaration, every UpdatePointerVal through a pointer the type of the
+cell it was created with, and every Call of a procedure the same types of actual
+parameters. Types are inferred by unification (nothing has to be written in the
+program): a parameter that is never called with anything stays unknown.
+
+check(c) reports the first type error found, as an exception raised before anything
+is run, or returns the resolved program (see resolver.py) with every operator and
+conditional marked as "checked". sem and the closure compiler then leave out the type
+checks of those nodes (applyBinOperator, applyUnaryOperator and the condition of If).
+
+The checker is stricter than the interpreter: While and CIf conditions must be
+booleans and both branches of an If must have the same type, even though interpret
+would run such programs. Errors that depend on
+which names are bound at run time (like "Name Not Found") are still reported when
+the program runs. Reading a cell through a pointer after it was destroyed is an error
+too, unless the cell was allocated again in the meantime, in which case it may hold a
+value of another type. So a program that destroys pointers and allocates cells of more
+than one type gets no node marked as checked: a value read from a reused cell could
+reach any operator, through variables and parameters as well.
+"""
+
+from dataclasses import dataclass
+
+from Interpreter import (
+    Int, Plus, Mult, Minus, Bool, And, Or, Not, Equal, If, Deref, Val,
+    Assign, While, CIf, Procedure, Call, NewPointer, DestroyPointer, UpdatePointerVal, Block, Show,
+    Decl, Exp, Com, Address,
+)
+from parser import unparse
+from resolver import resolve
+
+# --------------------------------------------
+# TYPES
+# --------------------------------------------
+
+INT = "int"
+BOOL = "bool"
+
+class TVar:
+    """
+    An unknown type, which becomes "ref" once it is unified with another type
+    """
+    __slots__ = ("ref",)
+
+    def __init__(self):
+        self.ref = None
+
+@dataclass(frozen=True)
+class TPointer:
+    target: "Type"
+
+@dataclass(frozen=True)
+class TProc:
+    params: tuple["Type", ...]
+
+Type = str | TVar | TPointer | TProc
+
+def prune(t: Type) -> Type:
+    """
+    Returns the type an unknown type has become, or the unknown type itself
+    """
+    while type(t) is TVar and t.ref is not None:
+        t = t.ref
+    return t
+
+def show(t: Type) -> str:
+    t = prune(t)
+    match t:
+        case TVar():
+            return "unknown"
+        case TPointer(target):
+            return f"pointer to {show(target)}"
+        case TProc(params):
+            return f"procedure({', '.join(show(p) for p in params)})"
+        case _:
+            return t
+
+def where(node) -> str:
+    """
+    Returns the beginning of the source of a node, to point at it in error messages
+    """
+    source = unparse(node)
+    return source if len(source) <= 60 else source[:57] + "..."
+
+# --------------------------------------------
+# CHECKER
+# --------------------------------------------
+
+class Checker:
+    """
+    The Checker class gives a type to every slot of every frame of a resolved program
+    (see resolver.py). Frames are numbered as they are met, a slot being identified by
+    its frame number and its slot number.
+    """
+
+    def __init__(self):
+        self.slots: dict[tuple[int, int], TVar] = {}
+        self.frames = 0
+        self.checked: list[Exp] = []
+
+        # Types that must end up being values (not procedures), or expressible values
+        # (not pointers either), with the node requiring it
+        self.values: list[tuple[Type, object]] = []
+        self.expressible: list[tuple[Type, object]] = []
+
+        # Types of the heap cells allocated by the program, and whether it destroys any
+        self.cells: list[Type] = []
+        self.destroys = False
+
+    def new_frame(self) -> int:
+        self.frames += 1
+        return self.frames
+
+    def slot(self, frames: list[int], depth: int, slot: int) -> TVar:
+        """
+        Returns the type of the slot "slot" of the frame "depth" static links out
+        """
+        key = (frames[depth], slot)
+        if key not in self.slots:
+            self.slots[key] = TVar()
+        return self.slots[key]
+
+    def address(self, addr: Address, frames: list[int], node) -> Type:
+        """
+        Returns the type of a resolved identifier. All the slots that may bind it must have the same type.
+        """
+        candidates = [self.slot(frames, depth, slot) for (depth, slot) in (a for a in addr if a is not None)]
+        for t in candidates[1:]:
+            self.unify(candidates[0], t, node)
+        return candidates[0]
+
+    def unify(self, found: Type, expected: Type, node):
+        """
+        Makes the two types equal, or raises a type error
+        """
+        found = prune(found)
+        expected = prune(expected)
+        if found is expected:
+            return
+        if type(found) is TVar:
+            found.ref = expected
+        elif type(expected) is TVar:
+            expected.ref = found
+        elif type(found) is TPointer and type(expected) is TPointer:
+            self.unify(found.target, expected.target, node)
+        elif type(found) is TProc and type(expected) is TProc:
+            if len(found.params) != len(expected.params):
+                raise Exception(f"Type Error in {where(node)}: wrong number of parameters")
+            for (t1, t2) in zip(found.params, expected.params):
+                self.unify(t1, t2, node)
+        elif found != expected:
+            raise Exception(f"Type Error in {where(node)}: expected {show(expected)}, found {show(found)}")
+
+    def exp(self, ex: Exp, frames: list[int]) -> Type:
+        """
+        Returns the type of an expression
+        """
+        match ex:
+            case Int(_):
+                return INT
+
+            case Bool(_):
+                return BOOL
+
+            case Plus(e1, e2) | Mult(e1, e2) | And(e1, e2) | Or(e1, e2):
+                typ = INT if type(ex) is Plus or type(ex) is Mult else BOOL
+                self.unify(self.exp(e1, frames), typ, ex)
+                self.unify(self.exp(e2, frames), typ, ex)
+                self.checked.append(ex)
+                return typ
+
+            case Minus(e) | Not(e):
+                typ = INT if type(ex) is Minus else BOOL
+                self.unify(self.exp(e, frames), typ, ex)
+                self.checked.append(ex)
+                return typ
+
+            case Equal(e1, e2):
+                # An int can be compared with a bool, they are just never equal
+                self.exp(e1, frames)
+                self.exp(e2, frames)
+                return BOOL
+
+            case If(c, e1, e2):
+                self.unify(self.exp(c, frames), BOOL, ex)
+                typ = self.exp(e1, frames)
+                self.unify(self.exp(e2, frames), typ, ex)
+                self.checked.append(ex)
+                return typ
+
+            case Deref(i):
+                target = TVar()
+                self.unify(self.address(ex.addr, frames, ex), TPointer(target), ex)
+                return target
+
+            case Val(i):
+                typ = self.address(ex.addr, frames, ex)
+                self.expressible.append((typ, ex))
+                return typ
+
+            case _:
+                raise Exception(f"Type Error in {where(ex)}: unknown expression")
+
+    def argument(self, ex: Exp, frames: list[int]) -> Type:
+        """
+        Returns the type of an actual parameter. Variables are passed as their storable
+        value, which can be a pointer.
+        """
+        match ex:
+            case Val(i):
+                typ = self.address(ex.addr, frames, ex)
+                self.values.append((typ, ex))
+                return typ
+            case _:
+                return self.exp(ex, frames)
+
+    def com(self, c: Com, frames: list[int]):
+        """
+        Checks a command
+        """
+        match c:
+            case Assign(i, exp):
+                typ = self.address(c.addr, frames, c)
+                self.values.append((typ, c))
+                self.unify(self.argument(exp, frames), typ, c)
+
+            case While(e, b):
+                self.unify(self.exp(e, frames), BOOL, c)
+                self.com(b, frames)
+
+            case CIf(e, b1, b2):
+                self.unify(self.exp(e, frames), BOOL, c)
+                self.com(b1, frames)
+                self.com(b2, frames)
+
+            case Procedure(name, formal_par, body):
+                body_frames = [self.new_frame()] + frames
+                params = tuple(self.slot(body_frames, 0, slot) for slot in c.param_slots)
+                for typ in params:
+                    self.values.append((typ, c))
+                self.unify(self.slot(frames, 0, c.slot), TProc(params), c)
+                for b in body:
+                    self.com(b, body_frames)
+
+            case Call(i, actual_par):
+                args = tuple(self.argument(e, frames) for e in actual_par)
+                self.unify(TProc(args), self.address(c.addr, frames, c), c)
+
+            case NewPointer(i, exp):
+                typ = self.exp(exp, frames)
+                self.cells.append(typ)
+                self.unify(self.slot(frames, 0, c.slot), TPointer(typ), c)
+
+            case DestroyPointer(i):
+                self.destroys = True
+                self.unify(self.address(c.addr, frames, c), TPointer(TVar()), c)
+
+            case UpdatePointerVal(i, exp):
+                self.unify(self.address(c.addr, frames, c), TPointer(self.exp(exp, frames)), c)
+
+            case Block(dl, cl):
+                block_frames = [self.new_frame()] + frames
+                for d in dl:
+                    match d:
+                        case Decl(i, e):
+                            self.unify(self.slot(block_frames, 0, d.slot), self.exp(e, block_frames), d)
+                        case _:
+                            raise Exception(f"Type Error in {where(d)}: invalid declaration")
+                for b in cl:
+                    self.com(b, block_frames)
+
+            case Show(exp):
+                self.exp(exp, frames)
+
+            case _:
+                raise Exception(f"Type Error in {where(c)}: unknown command")
+
+    def finish(self):
+        """
+        Checks the constraints that can only be checked once every type is known
+        """
+        for (typ, node) in self.values:
+            if type(prune(typ)) is TProc:
+                raise Exception(f"Type Error in {where(node)}: expected a variable, found a procedure")
+        for (typ, node) in self.expressible:
+            if type(prune(typ)) is TPointer:
+                raise Exception(f"Type Error in {where(node)}: pointers are not expressible")
+        if self.destroys and not self.same_cells():
+            return
+        for ex in self.checked:
+            ex.checked = True
+
+    def same_cells(self) -> bool:
+        """
+        Returns whether every heap cell of the program holds a value of the same known
+        type, in which case a destroyed cell allocated again still has that type
+        """
+        types = {prune(t) for t in self.cells}
+        return len(types) <= 1 and not any(type(t) is TVar for t in types)
+
+def check(c: Com, resolved: bool = False) -> Com:
+    """
+    Type checks the command "c". Returns it resolved (unless it is "resolved" already),
+    with its operators and conditionals marked as checked, or raises the first type error.
+    """
+    if not resolved:
+        c = resolve(c)
+    checker = Checker()
+    checker.com(c, [])
+    checker.finish()
+    return c
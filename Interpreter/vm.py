@@ -0,0 +1,694 @@
+"""
+BYTECODE VIRTUAL MACHINE
+
+Compiles a resolved program (see resolver.py) into a flat stack-based bytecode held in
+an array('i'), and runs it with a single dispatch loop. The VM keeps its own operand
+stack, call stack and frames, so it does not recurse in Python on nested blocks or
+procedure calls, and it does not build dataclasses for the values it computes.
+
+Values on the operand stack and in frames are native (see NATIVE VALUES in
+Interpreter.py): plain Python ints and bools, and Pointers in variables. Frames are
+lists as in compiler.py: slot 0 holds the frame of the static link. The heap is the
+Heap of Interpreter.py, used through its native methods, and ends up in the same
+state as with interpret.
+
+Name operands are encoded as two ints (depth, slot). A depth of -1 means the name has
+several candidate addresses, and the slot is then an index in Program.addresses.
+
+A Machine can also run for a limited number of steps or seconds and be resumed later
+(see SUSPENDED EXECUTION), which interpret, recursing in Python, cannot do.
+
+Difference with interpret: when a command has two errors (e.g. an Assign to a
+procedure name with an ill-typed expression) the one of the expression is reported.
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Iterable, Iterator
+
+from Interpreter import (
+    Int, Plus, Mult, Minus, Bool, And, Or, Not, Equal, If, Deref, Val,
+    Assign, While, CIf, Procedure, Call, NewPointer, DestroyPointer, UpdatePointerVal, Block, Show,
+    Decl, Exp, Com, Address,
+    Pointer, Heap,
+    Output, BufferedOutput,
+)
+from resolver import resolve
+
+# --------------------------------------------
+# INSTRUCTION SET
+# --------------------------------------------
+
+OPCODES = [
+    "INT",          # k           push the integer k
+    "CONST",        # i           push consts[i]
+    "TRUE",         #             push True
+    "FALSE",        #             push False
+    "VAL",          # d s         push the value of a variable (not a pointer)
+    "DEREF",        # d s         push the value pointed by a pointer variable
+    "ADD",          #             pop two integers, push their sum
+    "MUL",          #             pop two integers, push their product
+    "NEG",          #             pop an integer, push its opposite
+    "AND",          #             pop two booleans, push their conjunction
+    "OR",           #             pop two booleans, push their disjunction
+    "NOT",          #             pop a boolean, push its negation
+    "EQ",           #             pop two values, push whether they are equal
+    "JUMP",         # t           go to t
+    "JUMP_UNLESS",  # t           pop a value, go to t unless it is True (While, CIf)
+    "BRANCH",       # t           pop a boolean, go to t if it is False (If)
+    "ASSIGN",       # d s         pop a value into a variable
+    "COPY",         # d s d2 s2   copy the storable value of a variable into another one
+    "ARG",          # d s         push the storable value of a variable (an actual parameter)
+    "STORE",        # s           pop a value into slot s of the current frame (Decl)
+    "PROC",         # s i         bind procs[i] in slot s of the current frame
+    "CALL",         # d s n       call a procedure with the n values on top of the stack
+    "RET",          #             return from a procedure
+    "ENTER",        # n           push a block frame of n slots
+    "LEAVE",        #             pop a block frame
+    "NEWPTR",       # s           pop a value into a new heap cell, bind a pointer to it in slot s
+    "FREE",         # d s         free the heap cell of a pointer variable
+    "UPDATE",       # d s         pop a value into the heap cell of a pointer variable
+    "SHOW",         #             pop a value and print it
+    "FAIL",         # i           raise an exception with message consts[i]
+    "HALT",         #             stop the machine
+]
+
+(INT, CONST, TRUE, FALSE, VAL, DEREF, ADD, MUL, NEG, AND, OR, NOT, EQ, JUMP, JUMP_UNLESS,
+ BRANCH, ASSIGN, COPY, ARG, STORE, PROC, CALL, RET, ENTER, LEAVE, NEWPTR, FREE, UPDATE,
+ SHOW, FAIL, HALT) = range(len(OPCODES))
+
+# Number of operands of every instruction
+OPERANDS = {INT: 1, CONST: 1, VAL: 2, DEREF: 2, JUMP: 1, JUMP_UNLESS: 1, BRANCH: 1, ASSIGN: 2,
+            COPY: 4, ARG: 2, STORE: 1, PROC: 2, CALL: 3, ENTER: 1, NEWPTR: 1, FREE: 2, UPDATE: 2,
+            FAIL: 1}
+
+# --------------------------------------------
+# VALUES
+# --------------------------------------------
+
+@dataclass
+class ProcInfo:
+    entry: int
+    param_slots: tuple[int, ...]
+    size: int
+
+class Closure:
+    """
+    Denotable value of a procedure: its code and the frame it was declared in
+    """
+    __slots__ = ("info", "frame")
+
+    def __init__(self, info: ProcInfo, frame: list):
+        self.info = info
+        self.frame = frame
+
+@dataclass
+class Program:
+    code: array = field(default_factory=lambda: array("i"))
+    consts: list = field(default_factory=list)
+    addresses: list[Address] = field(default_factory=list)
+    procs: list[ProcInfo] = field(default_factory=list)
+
+# --------------------------------------------
+# COMPILER
+# --------------------------------------------
+
+class Assembler:
+    """
+    The Assembler class emits the bytecode of a resolved program. Procedure bodies are
+    emitted after the main program, once its code is complete.
+    """
+
+    def __init__(self):
+        self.program = Program()
+        self.pending: list[tuple[int, list[Com]]] = []
+
+    def emit(self, *words: int) -> int:
+        """
+        Appends an instruction and returns its position
+        """
+        position = len(self.program.code)
+        self.program.code.extend(words)
+        return position
+
+    def label(self) -> int:
+        """
+        Returns the position of the next instruction
+        """
+        return len(self.program.code)
+
+    def patch(self, position: int, target: int):
+        """
+        Sets the jump target of the instruction at "position"
+        """
+        self.program.code[position + 1] = target
+
+    def const(self, v) -> int:
+        """
+        Returns the index of "v" in the constants of the program
+        """
+        self.program.consts.append(v)
+        return len(self.program.consts) - 1
+
+    def name(self, addr: Address) -> tuple[int, int]:
+        """
+        Encodes a resolved identifier as a (depth, slot) pair of operands
+        """
+        if len(addr) == 1:
+            return addr[0]
+        self.program.addresses.append(addr)
+        return (-1, len(self.program.addresses) - 1)
+
+    def exp(self, ex: Exp):
+        """
+        Emits the code pushing the value of an expression
+        """
+        match ex:
+            case Int(n):
+                if type(n) is int and -2**31 <= n < 2**31:
+                    self.emit(INT, n)
+                else:
+                    self.emit(CONST, self.const(n))
+            case Bool(b):
+                self.emit(TRUE if b else FALSE)
+            case Plus(e1, e2):
+                self.binary(ADD, e1, e2)
+            case Mult(e1, e2):
+                self.binary(MUL, e1, e2)
+            case And(e1, e2):
+                self.binary(AND, e1, e2)
+            case Or(e1, e2):
+                self.binary(OR, e1, e2)
+            case Equal(e1, e2):
+                self.binary(EQ, e1, e2)
+            case Minus(e):
+                self.exp(e)
+                self.emit(NEG)
+            case Not(e):
+                self.exp(e)
+                self.emit(NOT)
+            case If(c, e1, e2):
+                self.exp(c)
+                branch = self.emit(BRANCH, 0)
+                self.exp(e1)
+                jump = self.emit(JUMP, 0)
+                self.patch(branch, self.label())
+                self.exp(e2)
+                self.patch(jump, self.label())
+            case Deref(i):
+                self.emit(DEREF, *self.name(ex.addr))
+            case Val(i):
+                self.emit(VAL, *self.name(ex.addr))
+            case _:
+                self.emit(FAIL, self.const("Unknown Expression"))
+
+    def binary(self, op: int, e1: Exp, e2: Exp):
+        """
+        Emits the code of a binary operator
+        """
+        self.exp(e1)
+        self.exp(e2)
+        self.emit(op)
+
+    def com(self, c: Com):
+        """
+        Emits the code executing a command
+        """
+        match c:
+            case Assign(i, Val(x) as source):
+                self.emit(COPY, *self.name(c.addr), *self.name(source.addr))
+            case Assign(i, exp):
+                self.exp(exp)
+                self.emit(ASSIGN, *self.name(c.addr))
+            case While(e, b):
+                start = self.label()
+                self.exp(e)
+                exit = self.emit(JUMP_UNLESS, 0)
+                self.com(b)
+                self.emit(JUMP, start)
+                self.patch(exit, self.label())
+            case CIf(e, b1, b2):
+                self.exp(e)
+                branch = self.emit(JUMP_UNLESS, 0)
+                self.com(b1)
+                jump = self.emit(JUMP, 0)
+                self.patch(branch, self.label())
+                self.com(b2)
+                self.patch(jump, self.label())
+            case Procedure(name, formal_par, body):
+                info = ProcInfo(0, c.param_slots, c.size)
+                self.program.procs.append(info)
+                self.pending.append((len(self.program.procs) - 1, body))
+                self.emit(PROC, c.slot, len(self.program.procs) - 1)
+            case Call(i, actual_par):
+                for exp in actual_par:
+                    match exp:
+                        case Val(x):
+                            self.emit(ARG, *self.name(exp.addr))
+                        case _:
+                            self.exp(exp)
+                self.emit(CALL, *self.name(c.addr), len(actual_par))
+            case NewPointer(i, exp):
+                self.exp(exp)
+                self.emit(NEWPTR, c.slot)
+            case DestroyPointer(i):
+                self.emit(FREE, *self.name(c.addr))
+            case UpdatePointerVal(i, exp):
+                self.exp(exp)
+                self.emit(UPDATE, *self.name(c.addr))
+            case Block(dl, cl):
+                self.emit(ENTER, c.size)
+                for d in dl:
+                    match d:
+                        case Decl(i, e):
+                            self.exp(e)
+                            self.emit(STORE, d.slot)
+                        case _:
+                            self.emit(FAIL, self.const("Invalid Declaration"))
+                for b in cl:
+                    self.com(b)
+                self.emit(LEAVE)
+            case Show(exp):
+                self.exp(exp)
+                self.emit(SHOW)
+            case _:
+                self.emit(FAIL, self.const("Unknown command"))
+
+    def assemble(self, c: Com) -> Program:
+        """
+        Emits the whole program followed by the bodies of its procedures
+        """
+        self.com(c)
+        self.emit(HALT)
+        while self.pending:
+            (index, body) = self.pending.pop()
+            self.program.procs[index].entry = self.label()
+            for b in body:
+                self.com(b)
+            self.emit(RET)
+        return self.program
+
+def compile_vm(c: Com, resolved: bool = False) -> Program:
+    """
+    Resolves the command "c" (unless it is "resolved" already) and compiles it to bytecode
+    """
+    return Assembler().assemble(c if resolved else resolve(c))
+
+def disassemble(program: Program) -> str:
+    """
+    Returns a readable listing of the bytecode of a program
+    """
+    lines = []
+    code = program.code
+    pc = 0
+    while pc < len(code):
+        op = code[pc]
+        n = OPERANDS.get(op, 0)
+        operands = " ".join(str(w) for w in code[pc + 1:pc + 1 + n])
+        lines.append(f"{pc:6} {OPCODES[op]:<12} {operands}")
+        pc += 1 + n
+    return "\n".join(lines)
+
+# --------------------------------------------
+# MACHINE
+# --------------------------------------------
+
+# With a time budget, the clock is read once every TIME_CHECK steps
+TIME_CHECK = 1024
+
+def locate(program: Program, frame: list, d: int, s: int) -> tuple[list, int]:
+    """
+    Returns the frame and slot of an encoded name
+    """
+    if d >= 0:
+        for _ in range(d):
+            frame = frame[0]
+        return (frame, s)
+    for candidate in program.addresses[s]:
+        if candidate is None:
+            break
+        (depth, slot) = candidate
+        f = frame
+        for _ in range(depth):
+            f = f[0]
+        if f[slot] is not None:
+            return (f, slot)
+    raise Exception("Name Not Found")
+
+class Machine:
+    """
+    The Machine class holds the state of a running program: the program counter, the
+    current frame, the operand stack, the call stack and the heap. Shown values are
+    written to "out", by default to the standard output as soon as they are shown.
+    The heap of a machine must not be shared with another one (its garbage collector
+    only knows the pointers of this machine).
+    """
+
+    def __init__(self, program: Program, heap: Heap | None = None, out: Output | None = None):
+        self.program = program
+        self.heap = heap if heap is not None else Heap()
+        self.out = out if out is not None else BufferedOutput(size=1)
+        self.pc = 0
+        self.frame: list = [None]
+        self.stack: list = []
+        self.calls: list[tuple[int, list]] = []
+        self.halted = False
+        self.left: int | None = None
+        self.heap.roots = self.pointers
+
+    def frames(self) -> list[list]:
+        """
+        Returns the frames of the running procedures and blocks, the current one first
+        and then the one every caller will return to
+        """
+        return [self.frame] + [f for (_, f) in reversed(self.calls)]
+
+    def pointers(self) -> list[int]:
+        """
+        Returns the heap locations held by the pointers in all the live frames (the
+        current one, the ones of the callers and their static links) and on the stack
+        """
+        seen = set()
+        locations = [v.loc for v in self.stack if type(v) is Pointer]
+        for frame in [self.frame] + [f for (_, f) in self.calls]:
+            while frame is not None and id(frame) not in seen:
+                seen.add(id(frame))
+                locations.extend(v.loc for v in frame if type(v) is Pointer)
+                frame = frame[0]
+        return locations
+
+    def refill(self, deadline: float | None) -> int:
+        """
+        Returns the number of steps to run before the budget is looked at again, or 0
+        when it is spent
+        """
+        if deadline is not None and perf_counter() >= deadline:
+            return 0
+        if self.left is None:
+            return TIME_CHECK
+        ticks = self.left if deadline is None else min(self.left, TIME_CHECK)
+        self.left -= ticks
+        return ticks
+
+    def run(self, steps: int | None = None, seconds: float | None = None) -> bool:
+        """
+        Runs the program until HALT, or until "steps" steps have been run or "seconds"
+        seconds have passed, whichever comes first. A step is a jump or a procedure
+        call, the only instructions that can make a program run indefinitely, so the
+        time between two steps is bounded by the size of the program. Returns whether
+        the program is done: if it is not, the machine is suspended between two
+        instructions and run can be called again to resume it.
+        """
+        if self.halted:
+            return True
+        deadline = None if seconds is None else perf_counter() + seconds
+        if steps is None and deadline is None:
+            # Never reaches 0
+            ticks = -1
+        else:
+            self.left = steps
+            ticks = self.refill(deadline)
+            if ticks == 0:
+                return False
+
+        program = self.program
+        code = program.code
+        consts = program.consts
+        heap = self.heap
+        write = self.out.write
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        calls = self.calls
+        pc = self.pc
+        frame = self.frame
+
+        while True:
+            op = code[pc]
+
+            if op == VAL:
+                d = code[pc + 1]
+                if d == 0:
+                    v = frame[code[pc + 2]]
+                elif d == 1:
+                    v = frame[0][code[pc + 2]]
+                else:
+                    (f, s) = locate(program, frame, d, code[pc + 2])
+                    v = f[s]
+                t = type(v)
+                if t is Pointer:
+                    raise Exception("Variable contains a pointer, pointers are not expressible")
+                if t is Closure:
+                    raise Exception("Identifier is not bound to a variable")
+                push(v)
+                pc += 3
+
+            elif op == INT:
+                push(code[pc + 1])
+                pc += 2
+
+            elif op == ADD or op == MUL:
+                b = pop()
+                a = pop()
+                if type(a) is not int or type(b) is not int:
+                    raise Exception("Wrong Types in Binary Operation")
+                push(a + b if op == ADD else a * b)
+                pc += 1
+
+            elif op == EQ:
+                b = pop()
+                a = pop()
+                push(type(a) is type(b) and a == b)
+                pc += 1
+
+            elif op == NOT:
+                a = pop()
+                if type(a) is not bool:
+                    raise Exception("Wrong Types in Unary Operation")
+                push(not a)
+                pc += 1
+
+            elif op == JUMP_UNLESS:
+                if pop() is True:
+                    pc += 2
+                else:
+                    pc = code[pc + 1]
+
+            elif op == JUMP:
+                pc = code[pc + 1]
+                ticks -= 1
+                if ticks == 0:
+                    ticks = self.refill(deadline)
+                    if ticks == 0:
+                        (self.pc, self.frame) = (pc, frame)
+                        return False
+
+            elif op == ASSIGN:
+                v = pop()
+                (f, s) = locate(program, frame, code[pc + 1], code[pc + 2])
+                if type(f[s]) is Closure:
+                    raise Exception("Identifier is not bound to a variable")
+                f[s] = v
+                pc += 3
+
+            elif op == DEREF:
+                (f, s) = locate(program, frame, code[pc + 1], code[pc + 2])
+                v = f[s]
+                if type(v) is Closure:
+                    raise Exception("Identifier is not bound to a variable")
+                if type(v) is not Pointer:
+                    raise Exception("Variable does not contain a pointer")
+                push(heap.apply_native(v.loc))
+                pc += 3
+
+            elif op == UPDATE:
+                v = pop()
+                (f, s) = locate(program, frame, code[pc + 1], code[pc + 2])
+                p = f[s]
+                if type(p) is Closure:
+                    raise Exception("Identifier is not bound to a variable")
+                if type(p) is not Pointer:
+                    raise Exception("Variable does not contain a pointer")
+                heap.update_native(p.loc, v)
+                pc += 3
+
+            elif op == SHOW:
+                write(pop())
+                pc += 1
+
+            elif op == ENTER:
+                new_frame = [None] * (code[pc + 1] + 1)
+                new_frame[0] = frame
+                frame = new_frame
+                pc += 2
+
+            elif op == LEAVE:
+                frame = frame[0]
+                pc += 1
+
+            elif op == STORE:
+                frame[code[pc + 1]] = pop()
+                pc += 2
+
+            elif op == AND or op == OR:
+                b = pop()
+                a = pop()
+                if type(a) is not bool or type(b) is not bool:
+                    raise Exception("Wrong Types in Binary Operation")
+                push((a and b) if op == AND else (a or b))
+                pc += 1
+
+            elif op == NEG:
+                a = pop()
+                if type(a) is not int:
+                    raise Exception("Wrong Types in Unary Operation")
+                push(-a)
+                pc += 1
+
+            elif op == TRUE:
+                push(True)
+                pc += 1
+
+            elif op == FALSE:
+                push(False)
+                pc += 1
+
+            elif op == CONST:
+                push(consts[code[pc + 1]])
+                pc += 2
+
+            elif op == BRANCH:
+                v = pop()
+                if type(v) is not bool:
+                    raise Exception("Non Boolean Condition in Conditional")
+                pc = pc + 2 if v else code[pc + 1]
+
+            elif op == ARG:
+                (f, s) = locate(program, frame, code[pc + 1], code[pc + 2])
+                v = f[s]
+                if type(v) is Closure:
+                    raise Exception("Variable was not properly declared or accessible")
+                push(v)
+                pc += 3
+
+            elif op == CALL:
+                (f, s) = locate(program, frame, code[pc + 1], code[pc + 2])
+                closure = f[s]
+                if type(closure) is not Closure:
+                    raise Exception("Attempting to call a non-callable value")
+                info = closure.info
+                n = code[pc + 3]
+                if len(info.param_slots) != n:
+                    raise Exception("Wrong number of parameters")
+                new_frame = [None] * (info.size + 1)
+                new_frame[0] = closure.frame
+                if n:
+                    for (slot, v) in zip(info.param_slots, stack[-n:]):
+                        new_frame[slot] = v
+                    del stack[-n:]
+                calls.append((pc + 4, frame))
+                frame = new_frame
+                pc = info.entry
+                ticks -= 1
+                if ticks == 0:
+                    ticks = self.refill(deadline)
+                    if ticks == 0:
+                        (self.pc, self.frame) = (pc, frame)
+                        return False
+
+            elif op == RET:
+                (pc, frame) = calls.pop()
+
+            elif op == COPY:
+                (f, s) = locate(program, frame, code[pc + 1], code[pc + 2])
+                if type(f[s]) is Closure:
+                    raise Exception("Identifier is not bound to a variable")
+                (f2, s2) = locate(program, frame, code[pc + 3], code[pc + 4])
+                v = f2[s2]
+                if type(v) is Closure:
+                    raise Exception("Variable does not contain a pointer")
+                f[s] = v
+                pc += 5
+
+            elif op == PROC:
+                frame[code[pc + 1]] = Closure(program.procs[code[pc + 2]], frame)
+                pc += 3
+
+            elif op == NEWPTR:
+                # The garbage collector finds the live frames from self.frame
+                self.frame = frame
+                frame[code[pc + 1]] = Pointer(heap.alloc_native(pop()))
+                pc += 2
+
+            elif op == FREE:
+                (f, s) = locate(program, frame, code[pc + 1], code[pc + 2])
+                p = f[s]
+                if type(p) is Closure:
+                    raise Exception("Identifier is not bound to a variable")
+                if type(p) is not Pointer:
+                    raise Exception("Variable does not contain a pointer")
+                heap.free(p.loc)
+                pc += 3
+
+            elif op == HALT:
+                self.pc = pc
+                self.frame = frame
+                self.halted = True
+                return True
+
+            elif op == FAIL:
+                raise Exception(consts[code[pc + 1]])
+
+            else:
+                raise Exception(f"Unknown instruction {op}")
+
+def interpret_vm(c: Com, heap: Heap | None = None, resolved: bool = False, out: Output | None = None):
+    """
+    Compiles the command "c" to bytecode and runs it on a new machine, with a new heap
+    unless one is given. Shown values are written to "out", by default to the standard
+    output through a buffer.
+    """
+    if out is None:
+        out = BufferedOutput()
+    try:
+        Machine(compile_vm(c, resolved), heap, out).run()
+    finally:
+        out.flush()
+
+# --------------------------------------------
+# SUSPENDED EXECUTION
+# --------------------------------------------
+
+def start(c: Com, heap: Heap | None = None, resolved: bool = False, out: Output | None = None) -> Machine:
+    """
+    Compiles the command "c" to bytecode and returns a machine ready to run it, without
+    running anything. Shown values are written to "out", by default to the standard
+    output as soon as they are shown.
+    """
+    return Machine(compile_vm(c, resolved), heap, out)
+
+def round_robin(machines: Iterable[Machine], steps: int = 10_000,
+                seconds: float | None = None) -> Iterator[tuple[Machine, Exception | None]]:
+    """
+    Runs the machines in turn, each one for at most "steps" steps (and "seconds"
+    seconds) at a time, in a single thread. Yields every machine once it is done,
+    with the error that stopped it or None. Output buffers are flushed at the end of
+    every slice.
+    """
+    running = list(machines)
+    while running:
+        still_running = []
+        for m in running:
+            try:
+                done = m.run(steps, seconds)
+            except Exception as e:
+                m.out.flush()
+                yield (m, e)
+                continue
+            m.out.flush()
+            if done:
+                yield (m, None)
+            else:
+                still_running.append(m)
+        running = still_running
@@ -1,4 +1,3 @@
-
 """
 NAND2Tetris Project 6 - Assembler
 Leticia Dupleich
@@ -6,10 +5,19 @@ Leticia Dupleich
 References:
 1. Nisan, N., & Schocken, S. (2005). Assembler. In The Elements of Computing Systems: Building a Modern
 Computer from First Principles (pp. 103-120). MIT Press.
+
+Usage:
+    python assembler.py < Prog.asm > Prog.hack              the .hack text format, one instruction per line
+    cat Prog.asm | python assembler.py --binary > Prog.bin  a raw image of 16 bit big-endian words
+    python assembler.py --parallel < Big.asm > Big.hack       translated on every core, for large inputs
 """
 
+import argparse
 import os
 import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # -----------------------------------------------------------------------
 # Module 1: Parse the symbolic command into its underlying fields.
@@ -17,222 +25,238 @@ import sys
 
 def initialize (input_file):
     """
-    This function goes through every command of the input file / assembler code and removes any comments and spaces.
-    These stripped commands are then saved into the list clean_commands. In order for the assembler to keep track of where
+    This function prepares the parser for the input file / assembler code. The lines are not read here: they are
+    read one at a time by hasMoreCommands(), as the commands are needed, so the input is read exactly once and
+    can be a pipe (which cannot be read a second time). In order for the assembler to keep track of where
     it is in the file (avoiding repition), we need to keep track of a state which can be done with classes, but I
     chose to implement a dictionary called "parser". 
     """
 
-    clean_commands = []
-    
-    for line in input_file:
-        line = line.partition("//")[0]
-        line = line.strip()
-
-        if line:
-            clean_commands.append(line)
-
-    # Index tracks which line we are in, current_command tracks the content of the line
-    parser = {"commands": clean_commands, "index": 0, "current_command": None}
+    # Lines tracks where we are in the file, next_command holds the command read ahead by hasMoreCommands(),
+    # current_command tracks the content of the line and instruction holds it once parsed. Parsed keeps the
+    # instruction of every different command met so far, since programs repeat the same few commands many times.
+    parser = {"lines": iter(input_file), "next_command": None, "current_command": None, "instruction": None,
+              "parsed": {}}
     
     return parser
 
 
 def hasMoreCommands (parser):
     """
-    This function simply checks if we still need to process more commands. If the function returns False,
-    then all of the commands have been processed.
+    This function checks if we still need to process more commands. It reads lines until it finds one that is
+    not empty once its comments and spaces are removed, and keeps it as the next command. If the function returns
+    False, then all of the commands have been processed.
     """
     
-    if parser["index"] < len(parser["commands"]):
+    if parser["next_command"] is not None:
         return True
-    else:
-        return False
+
+    for line in parser["lines"]:
+        line = line.partition("//")[0]
+        line = line.strip()
+
+        if line:
+            parser["next_command"] = line
+            return True
+
+    return False
 
 
 def advance (parser):
     """
-    This function reads the next command from the input file and makes it the current command. Since
+    This function makes the command read ahead by hasMoreCommands() the current command. Since
     the dictionary "parser" has been implemented to keep track of the state of the program, every time
     this function is called, the parser knows in which line to resume. This function should only be called
-    if the function hasMoreCommands() returns True.
+    if the function hasMoreCommands() returns True. The command is parsed here, once, into its instruction
+    (see parseCommand()), which the functions below read instead of looking at the command again.
     """
 
-    # The statement below works in this way: If index = 0, it gets command[0], if index = 1, it gets command[1]...
-    parser["current_command"] = parser["commands"][parser["index"]]
-    parser["index"] += 1
+    command = parser["next_command"]
+    parser["current_command"] = command
+    parser["next_command"] = None
 
+    instruction = parser["parsed"].get(command)
+    if instruction is None:
+        instruction = parseCommand(command)
+        parser["parsed"][command] = instruction
+    parser["instruction"] = instruction
 
-def commandType(parser):
+
+def parseCommand(command):
     """
-    This function determines what type of command each line / command is. An A_command (or instruction)
-    contains an "@" symbol before it (format: @Xxx) and denotes the case where Xxx is either a symbol
-    or a decimal number. An L_command (pseudocode command) is written in parentheses (format: (Xxx)) and denotes the
-    case where Xxx is a symbol. Finally, a C_command (compute instructions) has the format dest=comp;jump.
+    This function splits a command into its fields, which gives the intermediate representation of the instruction
+    as a tuple starting with its type. An A_command (or instruction) contains an "@" symbol before it (format: @Xxx)
+    and denotes the case where Xxx is either a symbol or a decimal number: it becomes ("A", Xxx), with Xxx as an int
+    if it is a number. An L_command (pseudocode command) is written in parentheses (format: (Xxx)) and denotes the
+    case where Xxx is a symbol: it becomes ("L", Xxx). Finally, a C_command (compute instructions) has the format
+    dest=comp;jump, where dest and jump are optional: it becomes ("C", dest, comp, jump), each field being the small
+    integer of its bits (see Module 2), so the command is split only once.
     """
-    
-    command = parser["current_command"]
 
     if command.startswith("@"):
-        return "A"
+        value = command[1:]
+        if value.isdigit():
+            return ("A", checkAddress(int(value), value))
+        return ("A", value)
     elif command.startswith("("):
-        return "L"
-    else:
-        return "C"
+        return ("L", command[1:-1])
 
+    # A dest part is present if there exists an "=" sign, and a jump part if there exists a ";" after the comp part
+    d, equal, rest = command.partition("=")
+    if not equal:
+        d, rest = "null", d
+    c, semicolon, j = rest.partition(";")
+    if not semicolon:
+        j = "null"
 
-def symbol(parser):
+    return ("C", dest_to_bin(d), comp_to_bin(c), jump_to_bin(j))
+
+
+def checkAddress(address, sym):
+    """
+    This function returns the address or constant of an A instruction, after checking that it fits in the 15 bits
+    the instruction has for it.
+    """
+
+    if address > 32767:
+        raise ValueError(f"@{sym}: {address} does not fit in the 15 bits of an A instruction")
+    return address
+
+
+def commandType(parser):
     """
-    This function returns the symbol or decimal Xxx of the current command @Xxx or (Xxx). Thus, it should be called
-    only when commandType() is A_command or L_command. If the command type is A then we want to return all the contents
-    after the "@" so we use the splicing [1:]. If the command type is L we want to return everything within the parentheses
-    so we use [1:-1] to splice.
+    This function returns the type of the current command: "A", "L" or "C" (see parseCommand()).
     """
     
-    command = parser["current_command"]
-    command_type = commandType(parser)
+    return parser["instruction"][0]
+
 
-    if command_type == "A":
-        return command[1:]
-    elif command_type == "L":
-        return command[1:-1]
+def symbol(parser):
+    """
+    This function returns the symbol or decimal Xxx of the current command @Xxx or (Xxx), a decimal being
+    returned as an int. Thus, it should be called only when commandType() is A_command or L_command.
+    """
+    
+    return parser["instruction"][1]
         
     
 def dest(parser):
     """
-    This function is used to extract the "dest" part of the C_command and thus should only be called when the commandType
-    function returns "C". A dest part is present if there exists an "=" sign in the command and it is located before the
-    "=" so it can be accessed by splitting the command at the equal sign and getting everything before it ([0]).
+    This function returns the 3 bits of the "dest" part of the C_command as an integer (0 if there is no dest part),
+    and thus should only be called when the commandType function returns "C".
     """
     
-    command = parser["current_command"]
-
-    if "=" in command:
-        return command.split("=")[0]
-    else:
-        return None
+    return parser["instruction"][1]
 
 
 def comp(parser):
     """
-    This function is used to extract the "comp" part of the C_command and thus should only be called when the commandType
-    function returns "C". A comp part is always present and it exists between the "=" (if there is one) and the ";" (if there
-    is one). So, to access this part, we need to determine which of the symbols is present and either get the part before ([0])
-    or after it ([1]).
+    This function returns the 7 bits of the "comp" part of the C_command as an integer, and thus should only be
+    called when the commandType function returns "C".
     """
     
-    command = parser["current_command"]
-
-    if "=" in command:
-        command = command.split("=")[1]
-    if ";" in command:
-        command = command.split(";")[0]
-    return command
+    return parser["instruction"][2]
 
 
 def jump(parser):
     """
-    This function is used to extract the "jump" part of the C_command and thus should only be called when the commandType
-    function returns "C". A jump part is present if there exists an ";" in the command and it is located after the
-    ";" so it can be accessed by splitting the command at the semi-colon and getting everything after it ([1]).
+    This function returns the 3 bits of the "jump" part of the C_command as an integer (0 if there is no jump part),
+    and thus should only be called when the commandType function returns "C".
     """
     
-    command = parser["current_command"]
-
-    if ";" in command:
-        return command.split(";")[1]
-    else:
-        return None
+    return parser["instruction"][3]
 
 # -----------------------------------------------------------------------
 # Module 2: Translates Hack assembly language mnemonics into binary codes.
 # -----------------------------------------------------------------------
 
+# The tables of translations provided in the written instructions for "Project 6", built once when the module
+# is loaded. Every mnemonic maps to its bits as an integer, ready to be shifted into place in an instruction.
+
+DEST_TABLE = {
+    "null": 0b000,
+    "M":    0b001,
+    "D":    0b010,
+    "MD":   0b011,
+    "A":    0b100,
+    "AM":   0b101,
+    "AD":   0b110,
+    "AMD":  0b111
+}
+
+# For the comp mnemonics, there are two cases for the first bit (a) depending on the register, namely A and M. For
+# register A, the a bit is 0, for register M, the a bit is 1.
+COMP_TABLE = {
+    "0":   0b0101010,
+    "1":   0b0111111,
+    "-1":  0b0111010,
+    "D":   0b0001100,
+    "A":   0b0110000,
+    "!D":  0b0001101,
+    "!A":  0b0110001,
+    "-D":  0b0001111,
+    "-A":  0b0110011,
+    "D+1": 0b0011111,
+    "A+1": 0b0110111,
+    "D-1": 0b0001110,
+    "A-1": 0b0110010,
+    "D+A": 0b0000010,
+    "D-A": 0b0010011,
+    "A-D": 0b0000111,
+    "D&A": 0b0000000,
+    "D|A": 0b0010101,
+    "M":   0b1110000,
+    "!M":  0b1110001,
+    "-M":  0b1110011,
+    "M+1": 0b1110111,
+    "M-1": 0b1110010,
+    "D+M": 0b1000010,
+    "D-M": 0b1010011,
+    "M-D": 0b1000111,
+    "D&M": 0b1000000,
+    "D|M": 0b1010101
+}
+
+JUMP_TABLE = {
+    "null": 0b000,
+    "JGT":  0b001,
+    "JEQ":  0b010,
+    "JGE":  0b011,
+    "JLT":  0b100,
+    "JNE":  0b101,
+    "JLE":  0b110,
+    "JMP":  0b111
+}
+
+# The bits of every byte as text, to write an instruction as the bits of its high byte and of its low byte
+BYTE_BITS = [f"{byte:08b}" for byte in range(256)]
+
+
 def dest_to_bin(mnemonics):
     """
-    This function returns the binary code for the "dest" mnemonic of a C_command which corresponds to 3 bits.
-    In order to do this, it uses a dictionary containing the table of translations provided in the written
-    instructions for "Project 6".
+    This function returns the binary code for the "dest" mnemonic of a C_command which corresponds to 3 bits,
+    as an integer.
     """
 
-    d_table = {
-        "null": "000",
-        "M": "001",
-        "D": "010",
-        "MD": "011",
-        "A": "100",
-        "AM": "101",
-        "AD": "110",
-        "AMD": "111"
-    }
-
-    binary = d_table[mnemonics]
-    return binary
+    return DEST_TABLE[mnemonics]
 
 
 def comp_to_bin(mnemonics):
     """
-    This function returns the binary code for the "comp" mnemonic of a C_command which corresponds to 7 bits.
-    In order to do this, it uses a dictionary containing the table of translations provided in the written
-    instructions for "Project 6". In this case, there are two cases for the first bit (a) depending on the register,
-    namely A and M. For register A, the a bit is 0, for register M, the a bit is 1.
-    """
-
-    c_table = {
-        "0": "0101010",
-        "1": "0111111",
-        "-1": "0111010",
-        "D": "0001100",
-        "A": "0110000",
-        "!D": "0001101",
-        "!A": "0110001",
-        "-D": "0001111",
-        "-A": "0110011",
-        "D+1": "0011111",
-        "A+1": "0110111",
-        "D-1": "0001110",
-        "A-1": "0110010",
-        "D+A": "0000010",
-        "D-A": "0010011",
-        "A-D": "0000111",
-        "D&A": "0000000",
-        "D|A": "0010101",
-        "M": "1110000",
-        "!M": "1110001",
-        "-M": "1110011",
-        "M+1": "1110111",
-        "M-1": "1110010",
-        "D+M": "1000010",
-        "D-M": "1010011",
-        "M-D": "1000111",
-        "D&M": "1000000",
-        "D|M": "1010101"
-    }
+    This function returns the binary code for the "comp" mnemonic of a C_command which corresponds to 7 bits,
+    as an integer.
+    """
 
-    binary = c_table[mnemonics]
-    return binary
+    return COMP_TABLE[mnemonics]
 
 
 def jump_to_bin(mnemonics):
     """
-    This function returns the binary code for the "jump" mnemonic of a C_command which corresponds to 3 bits.
-    In order to do this, it uses a dictionary containing the table of translations provided in the written
-    instructions for "Project 6".
+    This function returns the binary code for the "jump" mnemonic of a C_command which corresponds to 3 bits,
+    as an integer.
     """
 
-    j_table = {
-        "null": "000",
-        "JGT": "001",
-        "JEQ": "010",
-        "JGE": "011",
-        "JLT": "100",
-        "JNE": "101",
-        "JLE": "110",
-        "JMP": "111"
-    }
-
-    binary = j_table[mnemonics]
-    return binary
+    return JUMP_TABLE[mnemonics]
 
 # -----------------------------------------------------------------------
 # Module 3: Replace all symbolic references (if any) with numeric addresses of memory locations.
@@ -310,90 +334,172 @@ def getAddress(symbol, table):
 # Module 4: Main Program -> Assemble the binary codes into a complete machine instruction.
 # -----------------------------------------------------------------------
 
-def main():
-    """
-    In the main program we call all of the above functions to be able to translate the inputted asm file into a
-    binary code.
-    """
+# Characters of input (whole lines) translated by a worker at a time in parallel mode
+CHUNK_SIZE = 1 << 20
 
-    # Check if the input is via stdin, if not exit the code
-    if not sys.stdin.isatty():
-        assembly = sys.stdin
-        output_file = sys.stdout
-    else:
-        sys.exit(1)
 
-    # Initialize the parser and the symbols table
-    parser = initialize(assembly)
-    symbol_table = constructor()
+def translate(parser):
+    """
+    This function translates every command left in the parser. It returns the instructions as 16 bit words, with
+    a hole (0) for every A instruction with a symbol, which can refer to a label defined further down, the labels
+    with the index of the instruction they label and the (index, symbol) of the holes, in the order they appear in.
+    """
 
-    # --------------------------------
-    # First pass: Build symbol table
-    # --------------------------------
-    rom_address = 0
+    instructions = array("H")
+    references = []
+    labels = {}
 
     # Loop through all the lines of the input
     while hasMoreCommands(parser):
         advance(parser)
         command_type = commandType(parser)
 
-        # We want to translate A and C instructions so we increment the counter
-        if command_type == "A" or command_type == "C":
-            rom_address += 1
+        if command_type == "A":
+            sym = symbol(parser)
+
+            # If sym is a constant, then keep the number (starting with 0 since it is an A instruction)
+            if type(sym) is int:
+                instructions.append(sym)
 
-        # If the command is of type L, then add it to the table
+            # Otherwise, it is a label or a variable, which is only known at the end of the input
+            else:
+                references.append((len(instructions), sym))
+                instructions.append(0)
+
+        elif command_type == "C":
+
+            # Assemble the parts of the binary of a C instruction (starting with 111 since it is a C instruction)
+            instructions.append(0b111 << 13 | comp(parser) << 6 | dest(parser) << 3 | jump(parser))
+
+        # If the command is of type L, it labels the next instruction
         elif command_type == "L":
-            sym = symbol(parser)
-            addEntry((sym, rom_address), symbol_table)
+            labels[symbol(parser)] = len(instructions)
 
-    # --------------------------------
-    # Second pass: Translate to binary
-    # --------------------------------
+    return instructions, labels, references
 
-    # Restart the parser for the second looping
-    assembly.seek(0)
-    parser = initialize(assembly)
-    next_ram_address = 16
 
-    # Loop through all the lines of the input
-    while hasMoreCommands(parser):
-        advance(parser)
-        command_type = commandType(parser)
+def translateChunk(chunk):
+    """
+    This function translates a chunk of the input, made of whole lines, in a worker process (see translate()).
+    """
 
-        if command_type == "A":
-            sym = symbol(parser)
+    return translate(initialize(chunk.splitlines()))
 
-            # If sym is a constant, then keep the number as int
-            if sym.isdigit():
-                bin_num = int(sym)
 
-            # If sym is an existing symbol, get the address (binary) as an integer
-            elif contains(sym, symbol_table):
-                bin_num = int(getAddress(sym, symbol_table))
+def translateParallel(assembly, workers):
+    """
+    This function translates the input in chunks of about CHUNK_SIZE characters, on a pool of "workers" processes.
+    The chunks are translated independently, since only the symbols depend on the rest of the input, and their
+    results are merged in order: the indexes of every chunk are shifted by the number of instructions before it. A
+    chunk is sent as a single string, which is much cheaper to pass to a process than a list of lines. At most two
+    chunks per worker are read ahead, so the input is never held in memory all at once.
+    """
 
-            # If sym is a new variable, add it to the table and increment accordingly
-            else:
-                addEntry((sym, next_ram_address), symbol_table)
-                bin_num = next_ram_address
-                next_ram_address += 1
+    instructions = array("H")
+    references = []
+    labels = {}
 
-            # Wrute the binary in the output file (starting with 0 since it is an A instruction)
-            output_file.write(f"0{bin_num:015b}\n")
+    def merge(result):
+        chunk_instructions, chunk_labels, chunk_references = result
+        offset = len(instructions)
+        instructions.extend(chunk_instructions)
+        for sym, index in chunk_labels.items():
+            labels[sym] = index + offset
+        references.extend((index + offset, sym) for index, sym in chunk_references)
 
-        elif command_type == "C":
+    pending = deque()
+    with ProcessPoolExecutor(workers) as pool:
+        while True:
+            # The chunk ends with the end of the line it stops in
+            chunk = assembly.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            chunk += assembly.readline()
+            pending.append(pool.submit(translateChunk, chunk))
+            if len(pending) >= 2 * workers:
+                merge(pending.popleft().result())
+        while pending:
+            merge(pending.popleft().result())
 
-            # Find all the parts of the binary of a C instruction
-            d = dest(parser) or "null"
-            c = comp(parser)
-            j = jump(parser) or "null"
+    return instructions, labels, references
 
-            # Translate them to binary
-            bin_d = dest_to_bin(d)
-            bin_c = comp_to_bin(c)
-            bin_j = jump_to_bin(j)
 
-            # Write them in the output file (starting with 111 since it is a C instruction)
-            output_file.write(f"111{bin_c}{bin_d}{bin_j}\n")
+def backpatch(instructions, labels, references):
+    """
+    This function fills in the holes of the A instructions with a symbol, once the whole input has been translated.
+    """
+
+    symbol_table = constructor()
+
+    # Labels take precedence over the predefined symbols with the same name
+    for sym, rom_address in labels.items():
+        addEntry((sym, rom_address), symbol_table)
+
+    next_ram_address = 16
+
+    # Symbols are resolved in the order they appear in, so variables get the same addresses as in two passes
+    for index, sym in references:
+
+        # If sym is an existing symbol, get the address (binary) as an integer
+        if contains(sym, symbol_table):
+            instructions[index] = checkAddress(int(getAddress(sym, symbol_table)), sym)
+
+        # If sym is a new variable, add it to the table and increment accordingly
+        else:
+            addEntry((sym, next_ram_address), symbol_table)
+            instructions[index] = checkAddress(next_ram_address, sym)
+            next_ram_address += 1
+
+
+def main():
+    """
+    In the main program we call all of the above functions to be able to translate the inputted asm file into a
+    binary code. The input is read in a single pass: every command is translated as soon as it is read, except
+    for A instructions with a symbol, which can refer to a label defined further down. Those are left as holes
+    in the list of instructions and filled in (backpatched) once the whole input has been read. The instructions
+    are then written all at once, as text or (with --binary) as a binary image. With --parallel, the commands are
+    translated on several processes (one per core unless a number is given), which pays off for large inputs.
+    """
+
+    arguments = argparse.ArgumentParser(description="Translates Hack assembly from the standard input into binary code")
+    arguments.add_argument("--binary", action="store_true", help="write a raw image of 16 bit big-endian words")
+    arguments.add_argument("--parallel", type=int, nargs="?", const=0, metavar="WORKERS",
+                           help="translate on several processes (default: one per core)")
+    args = arguments.parse_args()
+
+    # Check if the input is via stdin, if not exit the code
+    if not sys.stdin.isatty():
+        assembly = sys.stdin
+        output_file = sys.stdout
+    else:
+        sys.exit(1)
+
+    # --------------------------------
+    # Single pass: Translate to binary
+    # --------------------------------
+
+    # An address that does not fit in an A instruction stops the assembler with its message
+    try:
+        if args.parallel is None:
+            instructions, labels, references = translate(initialize(assembly))
+        else:
+            instructions, labels, references = translateParallel(assembly, args.parallel or os.cpu_count() or 1)
+
+        # --------------------------------
+        # Backpatching: Resolve the symbols
+        # --------------------------------
+
+        backpatch(instructions, labels, references)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    # Write the binary in the output file, with the most significant byte of every word first
+    if args.binary:
+        if sys.byteorder == "little":
+            instructions.byteswap()
+        output_file.buffer.write(instructions.tobytes())
+    else:
+        output_file.write("".join([BYTE_BITS[word >> 8] + BYTE_BITS[word & 0xFF] + "\n" for word in instructions]))
 
 if __name__ == "__main__":
     main()
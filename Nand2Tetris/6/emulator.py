@@ -0,0 +1,309 @@
+"""
+NAND2Tetris Project 6 - Hack CPU Emulator
+Leticia Dupleich
+
+Runs the binary code written by assembler.py on an emulated Hack computer: 32K words of ROM holding the program,
+32K words of RAM with the screen memory map at SCREEN (16384) and the keyboard at KBD (24576), and the A, D and PC
+registers. The program stops after the given number of cycles, as soon as it reaches the usual final loop (@END,
+0;JMP jumping to itself), or when it runs past its last instruction.
+
+References:
+1. Nisan, N., & Schocken, S. (2005). Computer Architecture. In The Elements of Computing Systems: Building a Modern
+Computer from First Principles (pp. 79-101). MIT Press.
+
+Usage:
+    python emulator.py Max.hack --set 0=3 1=5 --show 2
+    python emulator.py Rect.hack --set 0=50 --screen rect.pbm
+    python emulator.py Pong.hack --cycles 10000000         a .hack file, or an image written with --binary
+"""
+
+import argparse
+import sys
+from array import array
+from time import perf_counter
+
+import assembler
+
+ROM_SIZE = 32768
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# The screen has 256 rows of 512 pixels, 32 words per row, the least significant bit of a word being the leftmost pixel
+SCREEN_ROWS = 256
+SCREEN_WORDS = 32
+
+# -----------------------------------------------------------------------
+# Module 1: Load the binary code into the ROM.
+# -----------------------------------------------------------------------
+
+def load(path):
+    """
+    This function returns the instructions of a program as 16 bit words. A .hack file has one instruction per line,
+    written in binary, any other file is read as the raw image of 16 bit big-endian words written by
+    "assembler.py --binary".
+    """
+
+    if path.endswith(".hack"):
+        with open(path) as input_file:
+            return array("H", [int(line, 2) for line in input_file if line.strip()])
+
+    words = array("H")
+    with open(path, "rb") as input_file:
+        words.frombytes(input_file.read())
+    if sys.byteorder == "little":
+        words.byteswap()
+    return words
+
+# -----------------------------------------------------------------------
+# Module 2: Decode the instructions once, before running them.
+# -----------------------------------------------------------------------
+
+# The operations of the ALU, where Y is the A register or M = RAM[A] depending on the a bit of the instruction,
+# numbered by how often they appear in programs like Pong, as the emulator tests them in that order
+(OP_D, OP_Y_PLUS_1, OP_Y, OP_Y_MINUS_1, OP_ZERO, OP_D_PLUS_Y, OP_NOT_Y, OP_ONE, OP_Y_MINUS_D, OP_D_MINUS_Y,
+ OP_D_OR_Y, OP_D_AND_Y, OP_D_PLUS_1, OP_D_MINUS_1, OP_MINUS_ONE, OP_NOT_D, OP_MINUS_D, OP_MINUS_Y, OP_HALT) = range(19)
+
+OPERATIONS = {
+    "D": OP_D, "0": OP_ZERO, "1": OP_ONE, "-1": OP_MINUS_ONE,
+    "!D": OP_NOT_D, "-D": OP_MINUS_D, "D+1": OP_D_PLUS_1, "D-1": OP_D_MINUS_1,
+    "A": OP_Y, "!A": OP_NOT_Y, "-A": OP_MINUS_Y, "A+1": OP_Y_PLUS_1, "A-1": OP_Y_MINUS_1,
+    "D+A": OP_D_PLUS_Y, "D-A": OP_D_MINUS_Y, "A-D": OP_Y_MINUS_D, "D&A": OP_D_AND_Y, "D|A": OP_D_OR_Y,
+    "M": OP_Y, "!M": OP_NOT_Y, "-M": OP_MINUS_Y, "M+1": OP_Y_PLUS_1, "M-1": OP_Y_MINUS_1,
+    "D+M": OP_D_PLUS_Y, "D-M": OP_D_MINUS_Y, "M-D": OP_Y_MINUS_D, "D&M": OP_D_AND_Y, "D|M": OP_D_OR_Y
+}
+
+# The 7 bits of every comp mnemonic (see assembler.py) and the operation they make the ALU do
+COMP_OPERATIONS = {bits: OPERATIONS[mnemonic] for mnemonic, bits in assembler.COMP_TABLE.items()}
+
+# Not an instruction of the computer: fills the ROM after the program, to stop it when it gets there
+HALT = (OP_HALT, 0, 0, 0)
+
+
+def decode(words):
+    """
+    This function decodes every instruction once, so that running it does not take its bits apart again. An A
+    instruction stays the integer it loads into A. A C instruction becomes the tuple (operation, m, dest, jump),
+    where m tells whether the ALU uses M instead of A, and dest and jump are the 3 bits of those fields. The rest
+    of the ROM, and one more word for a program that fills it, is filled with HALT.
+    """
+
+    rom = []
+    decoded = {}
+
+    for address, word in enumerate(words):
+        if word < 0x8000:
+            rom.append(word)
+        elif word not in decoded:
+            comp = word >> 6 & 0x7F
+            if comp not in COMP_OPERATIONS:
+                raise ValueError(f"ROM[{address}]: {word:016b} is not a Hack instruction")
+            decoded[word] = (COMP_OPERATIONS[comp], comp >> 6, word >> 3 & 7, word & 7)
+            rom.append(decoded[word])
+        else:
+            rom.append(decoded[word])
+
+    if len(rom) > ROM_SIZE:
+        raise ValueError(f"The program has {len(rom)} instructions, the ROM only holds {ROM_SIZE}")
+    rom.extend([HALT] * (ROM_SIZE + 1 - len(rom)))
+    return rom
+
+# -----------------------------------------------------------------------
+# Module 3: Run the program.
+# -----------------------------------------------------------------------
+
+def initialize(words):
+    """
+    Creates a new computer with the program "words" in its ROM. Just like in the assembler, the state is kept in a
+    dictionary called "machine", values being kept as unsigned 16 bit integers.
+    """
+
+    machine = {"rom": decode(words), "ram": [0] * RAM_SIZE, "A": 0, "D": 0, "pc": 0, "cycles": 0, "halted": False}
+
+    return machine
+
+
+def run(machine, cycles):
+    """
+    This function runs at most "cycles" instructions and returns how many it ran: fewer if the program reaches its
+    final loop (an unconditional jump to the instruction before it, which loads its own address into A) or HALT. The
+    registers and the RAM are kept in local variables while it runs, and every instruction is fetched already
+    decoded, so that a cycle costs as few Python operations as possible.
+    """
+
+    rom = machine["rom"]
+    ram = machine["ram"]
+    A = machine["A"]
+    D = machine["D"]
+    pc = machine["pc"]
+    done = cycles
+
+    for cycle in range(cycles):
+        instruction = rom[pc]
+
+        # A instruction
+        if instruction.__class__ is int:
+            A = instruction
+            pc += 1
+            continue
+
+        # C instruction: compute, in the order of how often the operations are used
+        operation, m, dest, jump = instruction
+        y = ram[A & 0x7FFF] if m else A
+
+        if operation == OP_D:
+            out = D
+        elif operation == OP_Y_PLUS_1:
+            out = (y + 1) & 0xFFFF
+        elif operation == OP_Y:
+            out = y
+        elif operation == OP_Y_MINUS_1:
+            out = (y - 1) & 0xFFFF
+        elif operation == OP_ZERO:
+            out = 0
+        elif operation == OP_D_PLUS_Y:
+            out = (D + y) & 0xFFFF
+        elif operation == OP_NOT_Y:
+            out = y ^ 0xFFFF
+        elif operation == OP_ONE:
+            out = 1
+        elif operation == OP_Y_MINUS_D:
+            out = (y - D) & 0xFFFF
+        elif operation == OP_D_MINUS_Y:
+            out = (D - y) & 0xFFFF
+        elif operation == OP_D_OR_Y:
+            out = D | y
+        elif operation == OP_D_AND_Y:
+            out = D & y
+        elif operation == OP_D_PLUS_1:
+            out = (D + 1) & 0xFFFF
+        elif operation == OP_D_MINUS_1:
+            out = (D - 1) & 0xFFFF
+        elif operation == OP_MINUS_ONE:
+            out = 0xFFFF
+        elif operation == OP_NOT_D:
+            out = D ^ 0xFFFF
+        elif operation == OP_MINUS_D:
+            out = -D & 0xFFFF
+        elif operation == OP_MINUS_Y:
+            out = -y & 0xFFFF
+        else:
+            done = cycle
+            machine["halted"] = True
+            break
+
+        # Store: M is written at the address A had before the instruction, which is also where a jump goes. Like the
+        # jumps, memory only sees the lower 15 bits of A.
+        address = A
+        if dest:
+            if dest & 1:
+                ram[A & 0x7FFF] = out
+            if dest & 2:
+                D = out
+            if dest & 4:
+                A = out
+
+        # Jump: the bits of the jump field are "less than 0", "equal to 0" and "greater than 0"
+        if jump:
+            if out == 0:
+                taken = jump & 2
+            elif out & 0x8000:
+                taken = jump & 4
+            else:
+                taken = jump & 1
+            if taken:
+                if jump == 7 and address == pc - 1 and rom[address] == address:
+                    pc = address
+                    done = cycle + 1
+                    machine["halted"] = True
+                    break
+                pc = address & 0x7FFF
+                continue
+        pc += 1
+
+    machine["A"] = A
+    machine["D"] = D
+    machine["pc"] = pc
+    machine["cycles"] += done
+    return done
+
+
+def setKey(machine, code):
+    """
+    This function presses the key with the given code on the keyboard (0 releases it).
+    """
+
+    machine["ram"][KBD] = code
+
+
+def signed(value):
+    """
+    This function returns the value of a 16 bit word as a signed integer.
+    """
+
+    return value - 0x10000 if value & 0x8000 else value
+
+# -----------------------------------------------------------------------
+# Module 4: Show the screen.
+# -----------------------------------------------------------------------
+
+# Every byte with its bits in the reverse order: the screen starts a row with the least significant bit of a word,
+# an image with the most significant bit of a byte
+REVERSED_BITS = bytes(int(f"{byte:08b}"[::-1], 2) for byte in range(256))
+
+
+def writeScreen(machine, path):
+    """
+    This function writes the screen as a black and white PBM image of 512 x 256 pixels.
+    """
+
+    ram = machine["ram"]
+    pixels = bytearray()
+    for word in ram[SCREEN:SCREEN + SCREEN_ROWS * SCREEN_WORDS]:
+        pixels.append(REVERSED_BITS[word & 0xFF])
+        pixels.append(REVERSED_BITS[word >> 8])
+
+    with open(path, "wb") as output_file:
+        output_file.write(b"P4\n512 256\n" + bytes(pixels))
+
+# -----------------------------------------------------------------------
+# Module 5: Main Program -> Load a program, run it and show the results.
+# -----------------------------------------------------------------------
+
+def main():
+    """
+    In the main program we load the binary code, set the RAM words given with --set, run the program and print
+    how fast it ran and the RAM words given with --show.
+    """
+
+    arguments = argparse.ArgumentParser(description="Runs Hack binary code on an emulated Hack computer")
+    arguments.add_argument("program", help="a .hack file, or a binary image written by assembler.py --binary")
+    arguments.add_argument("--cycles", type=int, default=1_000_000, help="maximum number of cycles (default: 1000000)")
+    arguments.add_argument("--set", nargs="+", default=[], metavar="ADDRESS=VALUE", help="RAM words set before running")
+    arguments.add_argument("--show", nargs="+", type=int, default=[], metavar="ADDRESS", help="RAM words printed after")
+    arguments.add_argument("--key", type=int, default=0, help="code of the key held down on the keyboard")
+    arguments.add_argument("--screen", help="write the screen as a PBM image to this file")
+    args = arguments.parse_args()
+
+    try:
+        machine = initialize(load(args.program))
+        for assignment in args.set:
+            address, value = assignment.split("=")
+            machine["ram"][int(address)] = int(value) & 0xFFFF
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+    setKey(machine, args.key)
+
+    start = perf_counter()
+    cycles = run(machine, args.cycles)
+    elapsed = perf_counter() - start
+
+    state = "halted" if machine["halted"] else "stopped"
+    print(f"{state} after {cycles} cycles in {elapsed:.3f} s ({cycles / max(elapsed, 1e-9):,.0f} cycles/s)")
+    for address in args.show:
+        print(f"RAM[{address}] = {signed(machine['ram'][address])}")
+    if args.screen:
+        writeScreen(machine, args.screen)
+
+if __name__ == "__main__":
+    main()